@@ -0,0 +1,98 @@
+"""Compare the compiled subject classifier with the original keyword scans.
+
+Reports the best time of --repeat runs and the peak memory allocated while
+classifying one document.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_classifier [--size-mb 4] [--repeat 5]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from classifier import subject_classifier
+
+FILLER = ("the lecture covers several topics in detail and students should review "
+          "notes before the next session while practising with examples").split()
+
+
+def legacy_detect_subject(text):
+    """Subject detection as generate_ai_response did it before the classifier"""
+    text_lower = text.lower()
+
+    subject = "general"
+    if any(word in text_lower for word in ["math", "calculate", "equation", "algebra", "calculus"]):
+        subject = "math"
+    elif any(word in text_lower for word in ["history", "war", "king", "century", "ancient"]):
+        subject = "history"
+    elif any(word in text_lower for word in ["science", "physics", "chemistry", "biology", "atom"]):
+        subject = "science"
+    elif any(word in text_lower for word in ["programming", "code", "python", "java", "algorithm"]):
+        subject = "programming"
+    return subject
+
+
+def make_document(size, keyword=None, rng=None):
+    """Filler text of roughly `size` characters with an optional keyword near the end"""
+    rng = rng or random.Random(42)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(FILLER)
+        words.append(word)
+        length += len(word) + 1
+    if keyword == "thinking":
+        words.insert(10, keyword)
+    elif keyword:
+        words.insert(len(words) - len(words) // 10, keyword)
+    return " ".join(words)
+
+
+def peak_memory(fn, text):
+    """Peak bytes allocated while running fn(text)"""
+    tracemalloc.start()
+    try:
+        fn(text)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def best_of(fn, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=4.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    cases = [
+        ("no keyword (general)", None),
+        ("late math keyword", "algebra"),
+        ("late programming keyword", "algorithm"),
+        ("early history keyword", "thinking"),
+    ]
+
+    print(f"{'case':<28}{'legacy ms':>12}{'classify ms':>14}{'speedup':>10}{'legacy MB':>12}{'classify MB':>14}")
+    for label, keyword in cases:
+        text = make_document(size, keyword)
+        assert legacy_detect_subject(text) == subject_classifier.classify(text)
+        legacy = best_of(legacy_detect_subject, text, args.repeat)
+        compiled = best_of(subject_classifier.classify, text, args.repeat)
+        legacy_peak = peak_memory(legacy_detect_subject, text) / 2 ** 20
+        compiled_peak = peak_memory(subject_classifier.classify, text) / 2 ** 20
+        print(f"{label:<28}{legacy * 1000:>12.1f}{compiled * 1000:>14.1f}{legacy / compiled:>9.2f}x"
+              f"{legacy_peak:>12.2f}{compiled_peak:>14.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Time /api/materials?limit=100 with the to_dict() path and the raw JSON path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_materials_list [--rows 5000] [--limit 100] [--repeat 20]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def seed(db, StudyMaterial, rows):
+    now = datetime.utcnow()
+    flashcards = [
+        "Key Formula: Quadratic Equation - x = [-b ± √(b² - 4ac)] / 2a",
+        "Concept: Derivatives measure the rate of change of a function",
+        "Technique: Factorize polynomials to simplify equations"
+    ]
+    review_dates = [(now + timedelta(days=days)).strftime("%Y-%m-%d %H:00") for days in (0, 1, 3, 7)]
+    db.session.execute(db.insert(StudyMaterial), [
+        {
+            'input_text': f'Benchmark material {index} about quadratic equations',
+            'subject': 'math',
+            'summary': 'Mathematical Concept Analysis:\n- Identified core mathematical principles in the text',
+            'flashcards': flashcards,
+            'review_dates': review_dates,
+            'created_at': now - timedelta(seconds=index),
+            'processed_at': now - timedelta(seconds=index)
+        }
+        for index in range(rows)
+    ])
+    db.session.commit()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        from flask import jsonify
+        from cognigrasp_app import app, api_get_materials
+        from database import DatabaseManager
+        from models import db, StudyMaterial
+
+        with app.app_context():
+            DatabaseManager.init_db(sample_data=False)
+            seed(db, StudyMaterial, args.rows)
+
+        path = f'/api/materials?limit={args.limit}'
+
+        def to_dict_path():
+            # 改动前的实现：加载 ORM 对象，逐行 to_dict() 后整体 jsonify
+            with app.test_request_context(path):
+                materials = DatabaseManager.get_recent_materials(args.limit)
+                return jsonify([material.to_dict() for material in materials]).get_data()
+
+        def raw_json_path():
+            with app.test_request_context(path):
+                return api_get_materials().get_data()
+
+        assert len(to_dict_path()) > 0 and len(raw_json_path()) > 0
+        before = best_of(to_dict_path, args.repeat)
+        after = best_of(raw_json_path, args.repeat)
+
+    print(f"GET {path} ({args.rows} rows in table, best of {args.repeat})")
+    print(f"  to_dict + jsonify : {before * 1000:8.1f} ms")
+    print(f"  raw JSON columns  : {after * 1000:8.1f} ms")
+    print(f"  speedup           : {before / after:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
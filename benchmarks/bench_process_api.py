@@ -0,0 +1,59 @@
+"""Compare POST /process (HTML results page) with POST /api/process (JSON).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_process_api [--requests 300] [--chars 2000]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def timings(send, requests):
+    samples = []
+    for index in range(requests):
+        start = time.perf_counter()
+        response = send(index)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--chars', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        from cognigrasp_app import app
+        from database import DatabaseManager
+
+        with app.app_context():
+            DatabaseManager.init_db(sample_data=False)
+        client = app.test_client()
+        filler = "The quadratic equation has two roots. " * (args.chars // 38 + 1)
+
+        # 每次请求内容不同，避免命中结果缓存
+        def html(index):
+            return client.post('/process', data={'study_material': f'{index} {filler}'})
+
+        def api(index):
+            return client.post('/api/process', json={'study_material': f'{index} {filler}'})
+
+        html(-1), api(-1)  # 预热模板缓存和连接
+        html_median, html_p95, html_bytes = timings(html, args.requests)
+        api_median, api_p95, api_bytes = timings(api, args.requests)
+
+    print(f"{args.requests} requests each, {args.chars}-character material")
+    print(f"  POST /process     : median {html_median * 1000:6.2f} ms  p95 {html_p95 * 1000:6.2f} ms  {html_bytes} bytes")
+    print(f"  POST /api/process : median {api_median * 1000:6.2f} ms  p95 {api_p95 * 1000:6.2f} ms  {api_bytes} bytes")
+    print(f"  median speedup    : {html_median / api_median:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Related-materials TF-IDF index: lookup latency and recall as the corpus grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_related [--sizes 10000,100000,300000] [--queries 64]
+                                       [--max-query-terms 32] [--max-postings 2000]
+
+Documents are synthetic, drawn from a Zipf-distributed vocabulary, and
+indexed in memory (no database). For each corpus size the script reports
+build time, snapshot save and load time, the latency of one lookup and of a
+batch of --queries lookups (averaged per query), and recall@10 of the pruned lookup against
+exact scoring of every term and posting (one query at a time), which is
+what a brute-force comparison against all materials would return.
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from related import RelatedIndex, Segment, _postings, term_vector
+
+VOCABULARY = 50000
+TOPICS = 1000
+TOPIC_WORDS = 20
+
+
+def corpus(size, seed=0):
+    """Texts of 30-300 words: about 70% common background words, the rest from one of TOPICS topics"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f'w{index}' for index in range(VOCABULARY)] +
+                     [f't{index}' for index in range(TOPICS * TOPIC_WORDS)])
+    lengths = rng.integers(30, 300, size)
+    total = lengths.sum()
+    owner = np.repeat(np.arange(size), lengths)
+    topic = rng.integers(0, TOPICS, size)[owner]
+    tokens = np.where(rng.random(total) < 0.7,
+                      np.minimum(rng.zipf(1.2, total), VOCABULARY) - 1,
+                      VOCABULARY + topic * TOPIC_WORDS + rng.integers(0, TOPIC_WORDS, total))
+    bounds = np.r_[0, np.cumsum(lengths)]
+    return [' '.join(words[tokens[bounds[i]:bounds[i + 1]]]) for i in range(size)]
+
+
+def build(texts):
+    vectors = [term_vector(text) for text in texts]
+    doc, term, tf = _postings(vectors)
+    index = RelatedIndex()
+    np.add.at(index.df, term, 1)
+    index.doc_count = len(texts)
+    index.last_id = len(texts)
+    index._idf = index._compute_idf()
+    index.segments = [Segment.build(np.arange(1, len(texts) + 1), doc, term, tf, index._idf)]
+    return index
+
+
+def timed(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,300000')
+    parser.add_argument('--queries', type=int, default=64)
+    parser.add_argument('--max-query-terms', type=int, default=32)
+    parser.add_argument('--max-postings', type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        texts = corpus(size)
+        start = time.perf_counter()
+        index = build(texts)
+        build_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            index.save(tmp)
+            save_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            index = RelatedIndex.load(tmp, RelatedIndex.current_version(tmp))
+            load_seconds = time.perf_counter() - start
+
+            queries = [(material_id, texts[material_id - 1])
+                       for material_id in range(1, size + 1, size // args.queries)][:args.queries]
+            limits = (args.max_postings, args.max_query_terms)
+            single, _ = timed(lambda: [index.top_k([query], 10, *limits) for query in queries], repeat=3)
+            single /= len(queries)
+            batch, pruned = timed(lambda: index.top_k(queries, 10, *limits))
+            start = time.perf_counter()
+            exact = [index.top_k([query], 10)[0] for query in queries]
+            exact_each = (time.perf_counter() - start) / len(queries)
+
+        hits = sum(len({m for m, _ in a} & {m for m, _ in b}) for a, b in zip(pruned, exact))
+        recall = hits / max(sum(len(b) for b in exact), 1)
+        print(f"{size:8d} docs: build {build_seconds:6.1f} s, save {save_seconds * 1000:6.0f} ms, "
+              f"load {load_seconds * 1000:5.0f} ms | one at a time {single * 1000:6.2f} ms each, "
+              f"{len(queries)} batched {batch * 1000:7.1f} ms ({batch / len(queries) * 1000:5.2f} ms each), "
+              f"exact {exact_each * 1000:7.2f} ms each | recall@10 {recall:.3f}")
+
+
+if __name__ == '__main__':
+    main()
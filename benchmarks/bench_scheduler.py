@@ -0,0 +1,81 @@
+"""Time the vectorized SM-2 update against a per-review Python loop.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [--cards 1000000] [--reviews 3000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scheduler import DEFAULT_EASINESS, MIN_EASINESS, SECONDS_PER_DAY, apply_reviews
+
+
+def new_state(cards):
+    return {
+        'easiness': np.full(cards, DEFAULT_EASINESS),
+        'interval': np.zeros(cards),
+        'repetitions': np.zeros(cards, dtype=np.int64),
+        'due_at': np.zeros(cards, dtype='datetime64[s]'),
+        'last_reviewed_at': np.zeros(cards, dtype='datetime64[s]'),
+    }
+
+
+def loop_reviews(state, card_pos, quality, reviewed_at):
+    # 逐条复习的 Python 实现，作为对照
+    easiness = state['easiness'].tolist()
+    interval = state['interval'].tolist()
+    repetitions = state['repetitions'].tolist()
+    due_at = {}
+    for pos, q, at in zip(card_pos.tolist(), quality.tolist(), reviewed_at.astype(np.int64).tolist()):
+        if q >= 3:
+            if repetitions[pos] == 0:
+                interval[pos] = 1.0
+            elif repetitions[pos] == 1:
+                interval[pos] = 6.0
+            else:
+                interval[pos] = float(round(interval[pos] * easiness[pos]))
+            repetitions[pos] += 1
+            miss = 5.0 - q
+            easiness[pos] = max(MIN_EASINESS, easiness[pos] + (0.1 - miss * (0.08 + miss * 0.02)))
+        else:
+            interval[pos] = 1.0
+            repetitions[pos] = 0
+        due_at[pos] = at + int(interval[pos] * SECONDS_PER_DAY)
+    return easiness, interval, repetitions, due_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=1000000)
+    parser.add_argument('--reviews', type=int, default=3000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    card_pos = rng.integers(0, args.cards, args.reviews)
+    quality = rng.integers(0, 6, args.reviews).astype(np.float64)
+    start_at = np.datetime64('2026-01-01T00:00:00', 's')
+    reviewed_at = start_at + np.sort(rng.integers(0, 90 * SECONDS_PER_DAY, args.reviews)).astype('timedelta64[s]')
+
+    state = new_state(args.cards)
+    start = time.perf_counter()
+    apply_reviews(state, card_pos, quality, reviewed_at)
+    vectorized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    easiness, interval, repetitions, _ = loop_reviews(new_state(args.cards), card_pos, quality, reviewed_at)
+    looped = time.perf_counter() - start
+
+    assert np.allclose(state['easiness'], easiness) and np.allclose(state['interval'], interval)
+    assert (state['repetitions'] == np.array(repetitions)).all()
+
+    print(f"{args.reviews} reviews over {args.cards} cards")
+    print(f"  Python loop : {looped * 1000:10.1f} ms")
+    print(f"  NumPy       : {vectorized * 1000:10.1f} ms")
+    print(f"  speedup     : {looped / vectorized:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
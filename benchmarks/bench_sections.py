@@ -0,0 +1,56 @@
+"""Time analyze_sections() inline and on the process pool as documents grow.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sections [--sizes-kb 64,512,4096,16384] [--workers N] [--repeat 5]
+
+The pool is started and warmed up before timing, so the numbers are the
+per-request cost once a web worker has served its first long document;
+the one-off start-up time is reported separately. Use the results to pick
+SECTION_POOL_MIN_CHARS for the machine the app runs on.
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_classifier import make_document
+from sections import analyze_sections, get_pool, shutdown_pool
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes-kb', default='64,512,4096,16384')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    get_pool(args.workers)
+    analyze_sections(make_document(100000, 'algebra'), max_workers=args.workers)
+    print(f"pool start-up with {args.workers} worker(s): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    print(f"{'size':>10}{'sections':>10}{'inline ms':>12}{'pool ms':>10}{'speedup':>10}")
+    for size_kb in (int(value) for value in args.sizes_kb.split(',')):
+        # 每隔约 2 KB 一个空行，让文档能按段落切分
+        text = '\n\n'.join(make_document(2048, seed_keyword) for seed_keyword in
+                           [None] * (size_kb // 2 - 1) + ['algorithm'])
+        inline_result = analyze_sections(text, max_workers=0)
+        assert analyze_sections(text, max_workers=args.workers) == inline_result
+        inline = best_of(lambda: analyze_sections(text, max_workers=0), args.repeat)
+        pooled = best_of(lambda: analyze_sections(text, max_workers=args.workers), args.repeat)
+        print(f"{size_kb:>8}KB{len(inline_result[1]):>10}{inline * 1000:>12.1f}{pooled * 1000:>10.1f}"
+              f"{inline / pooled:>9.2f}x")
+    shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
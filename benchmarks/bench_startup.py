@@ -0,0 +1,45 @@
+"""Time worker startup: importing cognigrasp_app in a fresh interpreter and serving one request.
+
+Run from the repository root against an already initialized database:
+
+    flask --app cognigrasp_app init-db
+    python -m benchmarks.bench_startup [--repeat 10] [--repo PATH]
+
+--repo points at another checkout to compare against.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+WORKER = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "from cognigrasp_app import app\n"
+    "imported = time.perf_counter()\n"
+    "assert app.test_client().get('/api/stats').status_code == 200\n"
+    "print(imported - start, time.perf_counter() - start)\n"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--repo', default=os.getcwd())
+    args = parser.parse_args()
+
+    imports, first_requests = [], []
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, '-c', WORKER], cwd=args.repo, check=True,
+                                capture_output=True, text=True).stdout.split()
+        imports.append(float(output[0]))
+        first_requests.append(float(output[1]))
+
+    print(f"worker startup in {args.repo} (median of {args.repeat})")
+    print(f"  import cognigrasp_app   : {statistics.median(imports) * 1000:8.1f} ms")
+    print(f"  + first /api/stats call : {statistics.median(first_requests) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Fill a database with synthetic study materials and interactions for benchmarking.
+
+Run from the repository root:
+
+    python -m benchmarks.generate_data --database sqlite:///bench.db \
+        [--materials 1000000] [--interactions 3000000] [--batch-size 10000]
+
+Materials are spread across every subject and stored the way the app stores
+them (as references to the current subject config version), with review
+dates, stat counters, the review_dates table and (on SQLite) the full-text
+search index filled in afterwards.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+WORDS = {
+    'math': ['quadratic', 'equation', 'derivative', 'integral', 'matrix', 'theorem'],
+    'history': ['ancient', 'war', 'revolution', 'empire', 'treaty', 'dynasty'],
+    'science': ['photosynthesis', 'atom', 'molecule', 'gravity', 'cell', 'energy'],
+    'programming': ['python', 'algorithm', 'function', 'variable', 'recursion', 'compiler'],
+    'general': ['notes', 'chapter', 'summary', 'lecture', 'reading', 'outline'],
+}
+INTERACTION_TYPES = ['process', 'view', 'api_view', 'review']
+
+
+def material_rows(rng, count, start, versions, now):
+    subjects = list(WORDS)
+    for index in range(start, start + count):
+        subject = subjects[index % len(subjects)]
+        words = WORDS[subject]
+        created_at = now - timedelta(seconds=index * 7)
+        version_id, variations = versions[subject]
+        yield {
+            'input_text': ' '.join(rng.choice(words) for _ in range(rng.randint(20, 120))),
+            'subject': subject,
+            'summary': None,
+            'flashcards': None,
+            'config_version_id': version_id,
+            'variation_index': rng.randrange(variations),
+            'review_dates': [
+                (created_at + offset).strftime("%Y-%m-%d %H:00")
+                for offset in (timedelta(hours=6), timedelta(days=1), timedelta(days=3), timedelta(days=7))
+            ],
+            'created_at': created_at,
+            'processed_at': created_at,
+        }
+
+
+def interaction_rows(rng, count, max_material_id, now):
+    for _ in range(count):
+        interaction_type = rng.choice(INTERACTION_TYPES)
+        data = None
+        if interaction_type == 'review':
+            data = f'{{"card_index": {rng.randrange(3)}, "quality": {rng.randrange(6)}}}'
+        yield {
+            'material_id': rng.randint(1, max_material_id),
+            'interaction_type': interaction_type,
+            'interaction_data': data,
+            'created_at': now - timedelta(seconds=rng.randrange(90 * 86400)),
+        }
+
+
+def insert_batches(db, table, rows, batch_size):
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        inserted += len(batch)
+    return inserted
+
+
+def generate(db, materials, interactions, batch_size=10000, seed=0):
+    """Insert the synthetic rows into the database bound to the current app context"""
+    from database import DatabaseManager
+    from models import StudyMaterial, UserInteraction
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    configs = DatabaseManager.get_subject_configs()
+    versions = {subject: (configs[subject]['version_id'], len(configs[subject]['variations']))
+                for subject in WORDS}
+    start = db.session.query(db.func.count(StudyMaterial.id)).scalar()
+
+    timings = {}
+    began = time.perf_counter()
+    insert_batches(db, StudyMaterial.__table__, material_rows(rng, materials, start, versions, now), batch_size)
+    timings['materials'] = time.perf_counter() - began
+
+    max_id = db.session.query(db.func.max(StudyMaterial.id)).scalar()
+    began = time.perf_counter()
+    insert_batches(db, UserInteraction.__table__, interaction_rows(rng, interactions, max_id, now), batch_size)
+    timings['interactions'] = time.perf_counter() - began
+
+    # 核心层批量插入不经过 ORM 事件，派生表在最后统一重建
+    began = time.perf_counter()
+    DatabaseManager.rebuild_stat_counters()
+    DatabaseManager.backfill_review_dates(batch_size=batch_size)
+    if DatabaseManager.search_available():
+        DatabaseManager.backfill_search_index(batch_size=batch_size)
+    timings['derived'] = time.perf_counter() - began
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL, e.g. sqlite:///bench.db')
+    parser.add_argument('--materials', type=int, default=1000000)
+    parser.add_argument('--interactions', type=int, default=3000000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    from cognigrasp_app import app
+    from database import DatabaseManager
+    from models import db
+
+    with app.app_context():
+        DatabaseManager.init_db(sample_data=False)
+        timings = generate(db, args.materials, args.interactions, args.batch_size, args.seed)
+
+    print(f"{args.materials} materials in {timings['materials']:.1f} s, "
+          f"{args.interactions} interactions in {timings['interactions']:.1f} s, "
+          f"counters, review dates and search index in {timings['derived']:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Concurrent HTTP load test against a running CogniGrasp server.
+
+Start a server first, e.g. `gunicorn -w 4 cognigrasp_app:app`, then run
+from the repository root:
+
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 [--clients 16] [--duration 30]
+                                  [--mix process=1,material=5,api_material=3,materials=2,interaction=3,stats=1]
+                                  [--mix-from sqlite:///cognigrasp.db] [--output load.json]
+
+Each client is a thread with its own keep-alive connection picking
+endpoints at random according to the mix. With --mix-from, the ratios of
+process, material, api_material and interaction are taken from the
+interaction_type counts in that database's user_interactions table (see
+INTERACTION_ENDPOINTS) as shares summing to 1; entries given with --mix
+override the derived ones, so `--mix stats=0.05` adds stats at about 5%.
+Per endpoint the report shows throughput, p50/p95/p99 latency, the error
+rate and the rate of "database is locked" failures.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+SAMPLE_TEXT = ("The quadratic equation ax^2 + bx + c = 0 is solved with the quadratic formula. "
+               "Derivatives measure the rate of change of a function. ") * 5
+
+DEFAULT_MIX = {'process': 1, 'material': 5, 'api_material': 3, 'materials': 2, 'interaction': 3, 'stats': 1}
+
+# 交互类型对应产生它的请求：process/view/api_view 由页面和接口自动记录，
+# 其它类型（review 等）都是客户端通过 /api/interaction 提交的
+INTERACTION_ENDPOINTS = {'process': 'process', 'view': 'material', 'api_view': 'api_material'}
+
+
+def parse_mix(text):
+    """Parse 'name=weight,...' into a dict of endpoint weights"""
+    mix = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name}', expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def mix_from_interactions(connection):
+    """Endpoint shares (summing to 1) matching the interaction_type distribution of user_interactions"""
+    from sqlalchemy import text
+
+    rows = connection.execute(text(
+        "SELECT interaction_type, COUNT(*) FROM user_interactions GROUP BY interaction_type"))
+    mix = {}
+    for interaction_type, count in rows:
+        endpoint = INTERACTION_ENDPOINTS.get(interaction_type, 'interaction')
+        mix[endpoint] = mix.get(endpoint, 0) + count
+    total = sum(mix.values())
+    return {name: count / total for name, count in mix.items()}
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    return samples[min(max(int(len(samples) * fraction + 0.5) - 1, 0), len(samples) - 1)]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.locked = 0
+
+
+class Client:
+    """One keep-alive HTTP connection; request() returns (status, body)"""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        try:
+            self.connection.request(method, self.prefix + path, body, headers or {})
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # 连接被服务器关闭（如 gunicorn sync worker）时，下次请求重新连接
+            self.connection.close()
+            raise
+
+
+class LoadTest:
+    def __init__(self, url, mix, material_ids, timeout=30, seed=None):
+        self.url = url
+        self.names = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.names]
+        self.material_ids = material_ids
+        self.timeout = timeout
+        self.seed = seed
+        self.stats = {name: EndpointStats() for name in self.names}
+        self._lock = threading.Lock()
+        self._counter = iter(range(10 ** 12))
+
+    def _request(self, name, rng):
+        if name == 'process':
+            # 每次内容不同，避免命中结果缓存
+            body = json.dumps({'study_material': f'{next(self._counter)} {SAMPLE_TEXT}'})
+            return 'POST', '/api/process', body
+        if name == 'material':
+            return 'GET', f'/material/{rng.choice(self.material_ids)}', None
+        if name == 'api_material':
+            return 'GET', f'/api/materials/{rng.choice(self.material_ids)}', None
+        if name == 'materials':
+            return 'GET', '/api/materials', None
+        if name == 'interaction':
+            body = json.dumps({'material_id': rng.choice(self.material_ids), 'interaction_type': 'review',
+                               'card_index': rng.randrange(3), 'quality': rng.randrange(6)})
+            return 'POST', '/api/interaction', body
+        return 'GET', '/api/stats', None
+
+    def _client(self, index, deadline, requests):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        client = Client(self.url, self.timeout)
+        sent = 0
+        while time.perf_counter() < deadline and (requests is None or sent < requests):
+            name = rng.choices(self.names, self.weights)[0]
+            method, path, body = self._request(name, rng)
+            headers = {'Content-Type': 'application/json'} if body else {}
+            start = time.perf_counter()
+            try:
+                status, data = client.request(method, path, body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                status, data = None, str(e).encode()
+            elapsed = time.perf_counter() - start
+            sent += 1
+
+            with self._lock:
+                stats = self.stats[name]
+                stats.latencies.append(elapsed)
+                if status is None or status >= 400:
+                    stats.errors += 1
+                    if b'database is locked' in data:
+                        stats.locked += 1
+
+    def run(self, clients, duration, requests_per_client=None):
+        """Run `clients` concurrent clients for `duration` seconds; returns the report dict"""
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=self._client, args=(index, deadline, requests_per_client))
+                   for index in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        endpoints = {}
+        for name, stats in self.stats.items():
+            samples = sorted(stats.latencies)
+            count = len(samples)
+            endpoints[name] = {
+                'requests': count,
+                'throughput': count / elapsed,
+                'p50': percentile(samples, 0.50),
+                'p95': percentile(samples, 0.95),
+                'p99': percentile(samples, 0.99),
+                'error_rate': stats.errors / count if count else 0.0,
+                'locked_rate': stats.locked / count if count else 0.0,
+            }
+        total = sum(result['requests'] for result in endpoints.values())
+        return {
+            'clients': clients,
+            'elapsed': elapsed,
+            'requests': total,
+            'throughput': total / elapsed,
+            'endpoints': endpoints,
+        }
+
+
+def material_ids(url, timeout):
+    """Ids of recent materials on the server, creating a few when there are none"""
+    client = Client(url, timeout)
+    try:
+        status, body = client.request('GET', '/api/materials?limit=100')
+    except OSError as e:
+        raise SystemExit(f'Cannot reach the server at {url}: {e}')
+    if status != 200:
+        raise SystemExit(f'GET /api/materials returned {status}; is the server running at {url}?')
+    ids = [row['id'] for row in json.loads(body)]
+    while len(ids) < 5:
+        payload = json.dumps({'study_material': f'seed {len(ids)} {SAMPLE_TEXT}'})
+        status, body = client.request('POST', '/api/process', payload, {'Content-Type': 'application/json'})
+        if status != 200:
+            raise SystemExit(f'POST /api/process returned {status}: {body[:200]!r}')
+        ids.append(json.loads(body)['material_id'])
+    return ids
+
+
+def print_report(report, mix):
+    total_weight = sum(mix.values())
+    print(f"{report['clients']} clients, {report['requests']} requests in {report['elapsed']:.1f} s "
+          f"({report['throughput']:.1f} req/s)")
+    print(f"  {'endpoint':12s} {'mix':>6s} {'requests':>9s} {'req/s':>8s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'errors':>7s} {'locked':>7s}")
+    for name, result in report['endpoints'].items():
+        def ms(value):
+            return f'{value * 1000:8.2f}' if value is not None else f'{"-":>8s}'
+        print(f"  {name:12s} {mix[name] / total_weight:6.1%} {result['requests']:9d} {result['throughput']:8.1f} "
+              f"{ms(result['p50'])} {ms(result['p95'])} {ms(result['p99'])} "
+              f"{result['error_rate']:7.2%} {result['locked_rate']:7.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop each client after this many requests')
+    parser.add_argument('--mix', default='', help="endpoint weights, e.g. 'process=1,material=5'")
+    parser.add_argument('--mix-from', help='derive the mix from user_interactions in this database URL')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='write the report to this JSON file')
+    args = parser.parse_args()
+
+    try:
+        overrides = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.mix_from:
+        from sqlalchemy import create_engine
+
+        engine = create_engine(args.mix_from)
+        with engine.connect() as connection:
+            mix = mix_from_interactions(connection)
+        engine.dispose()
+        if not mix:
+            parser.error(f'no interactions found in {args.mix_from}')
+    else:
+        mix = dict(DEFAULT_MIX)
+    mix.update(overrides)
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+
+    ids = material_ids(args.url, args.timeout)
+    report = LoadTest(args.url, mix, ids, args.timeout, args.seed).run(args.clients, args.duration, args.requests)
+    report['mix'] = mix
+    print_report(report, mix)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
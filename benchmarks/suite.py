@@ -0,0 +1,178 @@
+"""Micro and macro benchmark suite with JSON results for regression tracking.
+
+Run from the repository root:
+
+    python -m benchmarks.suite [--database sqlite:///bench.db] [--output results.json]
+                               [--compare baseline.json] [--threshold 0.10]
+
+Without --database a temporary SQLite database is filled with --materials
+and --interactions synthetic rows (see benchmarks/generate_data.py). With
+--compare, every benchmark whose median is more than --threshold slower
+than in the baseline file is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SAMPLE_TEXT = ("The quadratic equation ax^2 + bx + c = 0 is solved with the quadratic formula. "
+               "Derivatives measure the rate of change of a function. ") * 20
+
+
+def measure(fn, iterations, warmup=3):
+    """Per-call timings of fn() in seconds, summarized"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'p95': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'mean': statistics.fmean(samples),
+    }
+
+
+def micro_benchmarks(app, iterations):
+    from cognigrasp_app import generate_ai_response
+    from database import DatabaseManager
+    from models import db, StudyMaterial
+
+    with app.app_context():
+        materials = StudyMaterial.query.order_by(StudyMaterial.id.desc()).limit(100).all()
+
+        def to_dict():
+            for material in materials:
+                material.to_dict()
+
+        results = {
+            'micro.generate_ai_response': measure(lambda: generate_ai_response(SAMPLE_TEXT), iterations),
+            'micro.get_subject_config': measure(lambda: DatabaseManager.get_subject_config('math'), iterations),
+            'micro.to_dict_x100': measure(to_dict, iterations),
+        }
+        db.session.rollback()
+    return results
+
+
+def macro_benchmarks(app, iterations):
+    from models import db, StudyMaterial
+
+    with app.app_context():
+        latest_id = db.session.query(db.func.max(StudyMaterial.id)).scalar()
+    client = app.test_client()
+    counter = iter(range(10 ** 9))
+
+    def get(path):
+        def call():
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+        return call
+
+    def process():
+        # 每次内容不同，避免命中结果缓存
+        response = client.post('/process', data={'study_material': f'{next(counter)} {SAMPLE_TEXT}'})
+        assert response.status_code == 200, response.status_code
+
+    return {
+        'macro.post_process': measure(process, iterations),
+        'macro.get_api_materials': measure(get('/api/materials'), iterations),
+        'macro.get_api_materials_limit_100': measure(get('/api/materials?limit=100'), iterations),
+        'macro.get_api_stats': measure(get('/api/stats'), iterations),
+        'macro.get_material_page': measure(get(f'/material/{latest_id}'), iterations),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks whose median regressed by more than `threshold` against `baseline`"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"  {name:38s} (not in baseline)")
+            continue
+        change = result['median'] / before['median'] - 1
+        flag = 'REGRESSION' if change > threshold else ''
+        print(f"  {name:38s} {before['median'] * 1000:9.3f} -> {result['median'] * 1000:9.3f} ms "
+              f"({change:+7.1%}) {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='benchmark an existing database instead of a temporary one')
+    parser.add_argument('--materials', type=int, default=20000)
+    parser.add_argument('--interactions', type=int, default=60000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = args.database or f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        from cognigrasp_app import app
+        from database import DatabaseManager
+        from models import db, StudyMaterial
+        from benchmarks.generate_data import generate
+
+        with app.app_context():
+            DatabaseManager.init_db(sample_data=False)
+            if not args.database:
+                generate(db, args.materials, args.interactions)
+            dataset = {
+                'materials': db.session.query(db.func.count(StudyMaterial.id)).scalar(),
+                'database': db.engine.dialect.name,
+            }
+
+        results = {}
+        results.update(micro_benchmarks(app, args.iterations))
+        results.update(macro_benchmarks(app, args.iterations))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dataset,
+        },
+        'results': results,
+    }
+
+    for name, result in sorted(results.items()):
+        print(f"{name:38s} median {result['median'] * 1000:9.3f} ms  p95 {result['p95'] * 1000:9.3f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} (commit {baseline['meta'].get('commit')})")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
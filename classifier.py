@@ -0,0 +1,122 @@
+"""Subject detection for study material.
+
+The keyword table is compiled once at import time. classify(), score() and
+scan() all make one pass over the text: it is read in cache-sized chunks,
+each lowercased on its own, and a keyword is no longer searched for once it
+has been seen, so no lowercased copy of the whole document is kept. Unless
+the scan is exhaustive (score()), it also drops keywords of subjects that
+can no longer win, and stops once nothing is left to look for.
+
+Keywords match anywhere in the text, not only as whole words, so each chunk
+is searched with CPython's substring search, which measured faster than one
+regex alternation over all keywords (see benchmarks/bench_classifier.py).
+"""
+
+# 学科关键词，按优先级排序（与原先 if/elif 链的顺序一致）
+SUBJECT_KEYWORDS = (
+    ("math", ("math", "calculate", "equation", "algebra", "calculus")),
+    ("history", ("history", "war", "king", "century", "ancient")),
+    ("science", ("science", "physics", "chemistry", "biology", "atom")),
+    ("programming", ("programming", "code", "python", "java", "algorithm")),
+)
+
+DEFAULT_SUBJECT = "general"
+
+
+class SubjectClassifier:
+    """Compiled keyword table shared by classify(), score() and incremental scans"""
+
+    def __init__(self, subject_keywords=SUBJECT_KEYWORDS, default_subject=DEFAULT_SUBJECT,
+                 chunk_size=16384):
+        self.subjects = tuple(subject for subject, _ in subject_keywords)
+        self.default_subject = default_subject
+        self.chunk_size = chunk_size
+
+        # keyword -> subject; a keyword listed under several subjects counts for the first
+        self.keyword_subject = {}
+        for subject, keywords in subject_keywords:
+            for keyword in keywords:
+                self.keyword_subject.setdefault(keyword.lower(), subject)
+        self.keywords = tuple(self.keyword_subject)
+        self.priority = {subject: index for index, subject in enumerate(self.subjects)}
+
+        # Characters carried over between chunks so keywords spanning a boundary are found
+        self.overlap = max((len(keyword) for keyword in self.keywords), default=1) - 1
+
+    def scan(self, exhaustive=False):
+        """Start an incremental scan; feed() it text as it arrives.
+
+        A non-exhaustive scan stops looking for keywords of subjects that can no
+        longer win, which is all classify() needs; score() scans exhaustively.
+        """
+        return ClassificationScan(self, exhaustive)
+
+    def score(self, text):
+        """Number of distinct keywords found per subject"""
+        scan = self.scan(exhaustive=True)
+        scan.feed(text)
+        return scan.scores()
+
+    def classify(self, text):
+        """Pick the highest-priority subject with any keyword hit"""
+        scan = self.scan()
+        scan.feed(text)
+        return scan.subject()
+
+
+class ClassificationScan:
+    """State of a single pass over one document"""
+
+    def __init__(self, classifier, exhaustive=False):
+        self.classifier = classifier
+        self.exhaustive = exhaustive
+        self.pending = list(classifier.keywords)
+        self.found = set()
+        self.tail = ""
+
+    def feed(self, text):
+        """Scan the next piece of the document"""
+        size = self.classifier.chunk_size
+        for start in range(0, len(text), size):
+            if not self.pending:
+                return
+            self._scan_chunk(text[start:start + size])
+
+    def _scan_chunk(self, chunk):
+        window = self.tail + chunk.lower()
+        still_pending = []
+        hit = False
+        for keyword in self.pending:
+            if keyword in window:
+                self.found.add(keyword)
+                hit = True
+            else:
+                still_pending.append(keyword)
+        self.pending = still_pending
+
+        if hit and not self.exhaustive:
+            # 只保留优先级更高的学科的关键词
+            priority = self.classifier.priority
+            keyword_subject = self.classifier.keyword_subject
+            best = min(priority[keyword_subject[keyword]] for keyword in self.found)
+            self.pending = [keyword for keyword in self.pending
+                            if priority[keyword_subject[keyword]] < best]
+
+        overlap = self.classifier.overlap
+        self.tail = window[-overlap:] if overlap else ""
+
+    def scores(self):
+        scores = {subject: 0 for subject in self.classifier.subjects}
+        for keyword in self.found:
+            scores[self.classifier.keyword_subject[keyword]] += 1
+        return scores
+
+    def subject(self):
+        scores = self.scores()
+        for subject in self.classifier.subjects:
+            if scores[subject]:
+                return subject
+        return self.classifier.default_subject
+
+
+subject_classifier = SubjectClassifier()
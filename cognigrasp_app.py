@@ -1,40 +1,28 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Blueprint, Response, current_app, render_template, request, jsonify, url_for, stream_with_context
 import random
-import re
-import os
-import json
-from datetime import datetime, timedelta
-from models import db
-from database import DatabaseManager
-from dotenv import load_dotenv
-
-load_dotenv()
-
-app = Flask(__name__)
-
-# 从环境变量获取配置，否则使用默认值
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or 'sqlite:///cognigrasp.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key'
-
-# Initialize database
-DatabaseManager.init_app(app)
+from datetime import datetime, timedelta, timezone
+from models import db, StudyMaterial, SubjectConfig
+from database import DatabaseManager, content_hash, search_match_query
+from classifier import subject_classifier
+from ingest import ingest_stream
+from sections import analyze_sections
+from worker import run_worker
+import click
+from werkzeug.exceptions import RequestEntityTooLarge
+from export import export_ndjson, register_export_commands
+from config import Config, engine_options
+from metrics import get_metrics, init_metrics, phase
+
+# 路由和命令注册在蓝图上，由 create_app() 挂到应用
+bp = Blueprint('cognigrasp', __name__, cli_group=None)
 
 
 # 模拟不同学科的知识处理
-def generate_ai_response(text):
-    text_lower = text.lower()
-
-    # 检测学科类型
-    subject = "general"
-    if any(word in text_lower for word in ["math", "calculate", "equation", "algebra", "calculus"]):
-        subject = "math"
-    elif any(word in text_lower for word in ["history", "war", "king", "century", "ancient"]):
-        subject = "history"
-    elif any(word in text_lower for word in ["science", "physics", "chemistry", "biology", "atom"]):
-        subject = "science"
-    elif any(word in text_lower for word in ["programming", "code", "python", "java", "algorithm"]):
-        subject = "programming"
+def generate_ai_response(text, subject=None):
+    # 检测学科类型（流式读取时已在读入过程中完成分类）
+    if subject is None:
+        with phase('classify'):
+            subject = subject_classifier.classify(text)
 
     # 从数据库获取学科配置
     subject_config = DatabaseManager.get_subject_config(subject)
@@ -62,99 +50,474 @@ def generate_ai_response(text):
     # 添加随机变体
     summary += f"\n\n{random.choice(subject_config['variations'])}"
 
-    # 生成复习计划
-    now = datetime.now()
-    review_dates = [
+    return {
+        "summary": summary,
+        "flashcards": flashcards,
+        "subject": subject,
+        "review_dates": generate_review_dates()
+    }
+
+
+def generate_review_dates():
+    # 生成复习计划（UTC，与 created_at 等时间戳一致）
+    now = datetime.utcnow()
+    return [
         (now + timedelta(hours=6)).strftime("%Y-%m-%d %H:00"),
         (now + timedelta(days=1)).strftime("%Y-%m-%d %H:00"),
         (now + timedelta(days=3)).strftime("%Y-%m-%d %H:00"),
         (now + timedelta(days=7)).strftime("%Y-%m-%d %H:00")
     ]
 
-    return {
-        "summary": summary,
-        "flashcards": flashcards,
-        "subject": subject,
-        "review_dates": review_dates
-    }
 
+def analyze_material(text, digest=None, subject=None):
+    """generate_ai_response, reusing the stored result for identical content.
+
+    Returns (ai_response, content_hash). Every submission still gets its own
+    material row and its own review dates; only the analysis is shared.
+    """
+    if digest is None:
+        digest = content_hash(text)
+    cached = DatabaseManager.get_cached_result(digest)
+    if cached is None:
+        return generate_ai_response(text, subject), digest
+    return dict(cached, review_dates=generate_review_dates()), digest
+
+
+def _with_cache_headers(response, etag, max_age):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
 
-@app.route('/')
+
+def _not_modified(etag, max_age):
+    """A 304 response if the client already holds `etag`, otherwise None"""
+    if request.if_none_match.contains(etag):
+        return _with_cache_headers(current_app.response_class(status=304), etag, max_age)
+    return None
+
+
+def _material_etag(version, prefix='material'):
+    material_id, processed_at = version
+    return f'{prefix}-{material_id}-{processed_at:%Y%m%d%H%M%S%f}'
+
+
+def _subject_config_etag(version):
+    config_id, updated_at = version
+    return f'subject-config-{config_id}-{updated_at:%Y%m%d%H%M%S%f}'
+
+
+@bp.route('/')
 def index():
     return render_template('cognigrasp_index.html')
 
 
-@app.route('/process', methods=['POST'])
+@bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Study material is too large'}), 413
+    return render_template('cognigrasp_index.html', error="Study material is too large."), 413
+
+
+def _save_and_log(study_material, ai_response, digest):
+    with phase('persist'):
+        # Save to database
+        material_id = DatabaseManager.save_material(
+            study_material,
+            ai_response["subject"],
+            ai_response["summary"],
+            ai_response["flashcards"],
+            ai_response["review_dates"],
+            content_hash=digest
+        )
+
+        # Log the processing interaction
+        DatabaseManager.log_interaction(material_id, "process")
+    return material_id
+
+
+def process_material(study_material, digest=None, subject=None):
+    """Analyze and save study material; returns (ai_response, material_id)"""
+    # 生成AI响应（相同内容直接复用已有结果）
+    ai_response, digest = analyze_material(study_material, digest, subject)
+    return ai_response, _save_and_log(study_material, ai_response, digest)
+
+
+@bp.route('/process', methods=['POST'])
 def process():
-    study_material = request.form['study_material']
+    # 在解析表单之前按 Content-Length 拒绝过大的请求
+    if request.content_length is not None and request.content_length > current_app.config['MAX_UPLOAD_BYTES']:
+        raise RequestEntityTooLarge()
+
+    upload = request.files.get('study_file')
+    if upload and upload.filename:
+        # 上传的文件分块读取，边读边分类
+        document = ingest_stream(upload.stream, current_app.config['MAX_UPLOAD_BYTES'])
+        study_material = document.text
+        digest, subject = document.content_hash, document.subject
+    else:
+        study_material = request.form['study_material']
+        digest = subject = None
 
     # 如果输入为空，返回错误
     if not study_material.strip():
         return render_template('cognigrasp_index.html', error="Please enter some study material.")
 
-    # 生成AI响应
-    ai_response = generate_ai_response(study_material)
+    ai_response, material_id = process_material(study_material, digest, subject)
 
-    # Save to database
-    material_id = DatabaseManager.save_material(
-        study_material,
-        ai_response["subject"],
-        ai_response["summary"],
-        ai_response["flashcards"],
-        ai_response["review_dates"]
-    )
+    with phase('render'):
+        return render_template('cognigrasp_results.html',
+                               summary=ai_response["summary"],
+                               flashcards=ai_response["flashcards"],
+                               subject=ai_response["subject"],
+                               review_dates=ai_response["review_dates"],
+                               original_input=study_material,
+                               material_id=material_id)
 
-    # Log the processing interaction
-    DatabaseManager.log_interaction(material_id, "process")
 
-    return render_template('cognigrasp_results.html',
-                           summary=ai_response["summary"],
-                           flashcards=ai_response["flashcards"],
-                           subject=ai_response["subject"],
-                           review_dates=ai_response["review_dates"],
-                           original_input=study_material,
-                           material_id=material_id)
+@bp.route('/api/process/upload', methods=['POST'])
+def api_process_upload():
+    """API endpoint to process a document sent as the raw request body"""
+    charset = request.mimetype_params.get('charset', 'utf-8')
+    try:
+        document = ingest_stream(request.stream, current_app.config['MAX_UPLOAD_BYTES'],
+                                 content_length=request.content_length, encoding=charset)
+    except LookupError:
+        return jsonify({'error': f'Unsupported charset: {charset}'}), 400
+    if not document.text.strip():
+        return jsonify({'error': 'No study material provided'}), 400
+
+    ai_response, material_id = process_material(document.text, document.content_hash, document.subject)
+    return jsonify(dict(ai_response, material_id=material_id))
+
+
+@bp.route('/api/process', methods=['POST'])
+def api_process():
+    """API endpoint to process study material sent as JSON, without rendering the results page"""
+    if request.content_length is not None and request.content_length > current_app.config['MAX_UPLOAD_BYTES']:
+        raise RequestEntityTooLarge()
+
+    data = request.get_json(silent=True)
+    study_material = data.get('study_material') if isinstance(data, dict) else None
+    if not isinstance(study_material, str) or not study_material.strip():
+        return jsonify({'error': 'No study material provided'}), 400
+
+    ai_response, material_id = process_material(study_material)
+    return jsonify(dict(ai_response, material_id=material_id))
+
+
+@bp.route('/api/process/sections', methods=['POST'])
+def api_process_sections():
+    """API endpoint to analyze a long document section by section in parallel"""
+    data = request.get_json(silent=True)
+    study_material = data.get('study_material') if isinstance(data, dict) else None
+    if not isinstance(study_material, str) or not study_material.strip():
+        return jsonify({'error': 'No study material provided'}), 400
+
+    with phase('classify'):
+        subject, sections = analyze_sections(study_material,
+                                             target_chars=current_app.config['SECTION_TARGET_CHARS'],
+                                             timeout=current_app.config['SECTION_TIMEOUT'],
+                                             max_workers=current_app.config['SECTION_POOL_WORKERS'],
+                                             min_pool_chars=current_app.config['SECTION_POOL_MIN_CHARS'])
+    for section in sections:
+        config = DatabaseManager.get_subject_config(section['subject'])
+        section['flashcards'] = config['flashcards'] if config else []
+
+    ai_response, material_id = process_material(study_material, subject=subject)
+    return jsonify(dict(ai_response, material_id=material_id, sections=sections))
+
+
+@bp.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """API endpoint to queue study material for asynchronous processing"""
+    data = request.get_json(silent=True)
+    study_material = data.get('study_material') if isinstance(data, dict) else None
+    if not isinstance(study_material, str) or not study_material.strip():
+        return jsonify({'error': 'No study material provided'}), 400
+
+    job_id = DatabaseManager.enqueue_job(study_material, max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
+    status_url = url_for('.api_get_job', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """API endpoint to poll an asynchronous processing job"""
+    job = DatabaseManager.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    data = job.to_dict()
+    if job.material_id:
+        data['material_url'] = url_for('.api_get_material', material_id=job.material_id)
+    return jsonify(data)
+
+
+@bp.route('/api/jobs/stats', methods=['GET'])
+def api_get_job_stats():
+    """API endpoint to get job queue depth"""
+    return jsonify(DatabaseManager.get_job_queue_stats())
+
+
+def process_job(job):
+    """Worker-side handler for a queued job: analyze, save and log like /process"""
+    _, material_id = process_material(job.input_text)
+    return material_id
+
+
+@bp.cli.command('reschedule-reviews')
+def reschedule_reviews_command():
+    """Apply new review interactions to the spaced-repetition schedule."""
+    # NumPy 只在调度任务中需要，不在 web worker 启动时导入
+    from scheduler import reschedule_reviews
+    applied = reschedule_reviews()
+    print(f'Applied {applied} review(s).')
+
+
+@bp.cli.command('build-related-index')
+def build_related_index_command():
+    """Rebuild the related-materials TF-IDF index and save a snapshot for the web workers."""
+    from related import build_related_index, index_path
+    indexed = build_related_index(index_path(current_app._get_current_object()))
+    print(f'Indexed {indexed} material(s).')
+
+
+@bp.cli.command('run-worker')
+@click.option('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+@click.option('--drain', is_flag=True, help='Exit once the queue is empty.')
+def run_worker_command(poll_interval, drain):
+    """Process queued /api/jobs submissions."""
+    handled = run_worker(current_app._get_current_object(), process_job, poll_interval=poll_interval,
+                         lease_seconds=current_app.config['JOB_LEASE_SECONDS'],
+                         retry_backoff=current_app.config['JOB_RETRY_BACKOFF'], drain=drain)
+    print(f'Processed {handled} job(s).')
+
+
+@bp.route('/api/process/batch', methods=['POST'])
+def api_process_batch():
+    """API endpoint to process many study materials in one request"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('study_materials'), list):
+        return jsonify({'error': 'Expected a JSON object with a study_materials list'}), 400
+
+    study_materials = data['study_materials']
+    if not study_materials:
+        return jsonify({'error': 'No study materials provided'}), 400
+
+    max_batch_size = current_app.config['MAX_BATCH_SIZE']
+    if len(study_materials) > max_batch_size:
+        return jsonify({'error': f'At most {max_batch_size} study materials per batch'}), 413
+
+    for index, study_material in enumerate(study_materials):
+        if not isinstance(study_material, str) or not study_material.strip():
+            return jsonify({'error': f'Study material at index {index} is empty or not a string'}), 400
+
+    results = []
+    for study_material in study_materials:
+        ai_response, digest = analyze_material(study_material)
+        results.append((study_material, ai_response, digest))
+    material_ids = DatabaseManager.save_materials(results)
+
+    return jsonify({
+        'results': [
+            dict(ai_response, material_id=material_id)
+            for material_id, (_, ai_response, _) in zip(material_ids, results)
+        ]
+    })
 
 
-@app.route('/api/materials', methods=['GET'])
+@bp.route('/api/materials', methods=['GET'])
 def api_get_materials():
-    """API endpoint to get processed materials"""
-    limit = request.args.get('limit', 10, type=int)
+    """API endpoint to get processed materials
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page.
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
     subject = request.args.get('subject', None)
+    cursor = request.args.get('cursor', None)
 
-    if subject:
-        materials = DatabaseManager.get_materials_by_subject(subject, limit)
-    else:
-        materials = DatabaseManager.get_recent_materials(limit)
+    # 多取一条用于判断是否还有下一页
+    try:
+        rows = DatabaseManager.get_materials_json(subject, limit + 1, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = DatabaseManager.encode_material_cursor(rows[-1])
+
+    # JSON 列直接使用存储的文本，避免逐行解码再编码
+    body = '[' + ', '.join(StudyMaterial.row_to_json(row) for row in rows) + ']\n'
+    response = current_app.response_class(body, mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = request.args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(".api_get_materials", **next_args)}>; rel="next"'
+    return response
+
+
+@bp.route('/api/reviews/due', methods=['GET'])
+def api_due_reviews():
+    """API endpoint to get review items due before a given time (ISO 8601, UTC if no offset; default: now)
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page.
+    """
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    cursor = request.args.get('cursor', None)
+    before = request.args.get('before', None)
+    try:
+        before = datetime.fromisoformat(before) if before else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'before must be an ISO 8601 datetime'}), 400
+    if before.tzinfo is not None:
+        # 复习时间都以不带时区的 UTC 存储
+        before = before.astimezone(timezone.utc).replace(tzinfo=None)
 
-    return jsonify([material.to_dict() for material in materials])
+    try:
+        rows = DatabaseManager.get_due_reviews(before, limit + 1, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = DatabaseManager.encode_review_cursor(rows[-1])
+
+    response = jsonify([
+        {
+            'material_id': row.material_id,
+            'position': row.position,
+            'source': row.source,
+            'due_at': row.due_at.isoformat(),
+            'material_url': url_for('.api_get_material', material_id=row.material_id)
+        }
+        for row in rows
+    ])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = request.args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(".api_due_reviews", **next_args)}>; rel="next"'
+    return response
+
+
+@bp.route('/api/materials/search', methods=['GET'])
+def api_search_materials():
+    """API endpoint to full-text search materials' input text and summary, best match first
+
+    Every word of `q` must match (`word*` matches a prefix). Matched terms in
+    `snippet` are wrapped in `**`. `order=newest` returns the newest matches
+    first and stays fast for very common words. Pass the `X-Next-Cursor`
+    response header back as `cursor` to get the next page.
+    """
+    if not DatabaseManager.search_available():
+        return jsonify({'error': 'Full-text search requires SQLite FTS5'}), 501
+
+    query = search_match_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    order = request.args.get('order', 'rank')
+    if order not in ('rank', 'newest'):
+        return jsonify({'error': "order must be 'rank' or 'newest'"}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    cursor = request.args.get('cursor', None)
+
+    try:
+        results = DatabaseManager.search_materials(query, limit + 1, cursor, order)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = DatabaseManager.encode_search_cursor(results[-1], order)
+
+    response = jsonify([
+        {
+            'id': result.id,
+            'subject': result.subject,
+            'rank': result.rank,
+            'snippet': result.snippet,
+            'created_at': result.created_at.isoformat(),
+            'material_url': url_for('.api_get_material', material_id=result.id)
+        }
+        for result in results
+    ])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = request.args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(".api_search_materials", **next_args)}>; rel="next"'
+    return response
 
 
-@app.route('/api/materials/<int:material_id>', methods=['GET'])
+@bp.route('/api/materials/<int:material_id>', methods=['GET'])
 def api_get_material(material_id):
     """API endpoint to get a specific material"""
-    material = DatabaseManager.get_material_by_id(material_id)
-    if not material:
+    version = DatabaseManager.get_material_version(material_id)
+    if not version:
         return jsonify({'error': 'Material not found'}), 404
 
     # Log the view interaction
     DatabaseManager.log_interaction(material_id, "api_view")
 
-    return jsonify(material.to_dict())
+    # 资料保存后不再修改，客户端已有相同版本时不必读取和序列化内容
+    etag = _material_etag(version)
+    max_age = current_app.config['MATERIAL_CACHE_MAX_AGE']
+    not_modified = _not_modified(etag, max_age)
+    if not_modified:
+        return not_modified
 
+    material = DatabaseManager.get_material_by_id(material_id)
+    return _with_cache_headers(jsonify(material.to_dict()), etag, max_age)
+
+
+@bp.route('/api/materials/<int:material_id>/related', methods=['GET'])
+def api_related_materials(material_id):
+    """API endpoint to get the materials whose input text is most similar (TF-IDF cosine similarity)"""
+    # NumPy 只在第一次查询相关资料时导入
+    from related import find_related
 
-@app.route('/api/stats', methods=['GET'])
+    material = db.session.query(StudyMaterial.id, StudyMaterial.input_text).filter_by(id=material_id).first()
+    if not material:
+        return jsonify({'error': 'Material not found'}), 404
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+
+    with phase('related'):
+        related = find_related(current_app._get_current_object(), [(material.id, material.input_text)], k)[0]
+    previews = DatabaseManager.get_material_previews([related_id for related_id, _ in related])
+    return jsonify([
+        {
+            'id': related_id,
+            'subject': previews[related_id].subject,
+            'score': round(score, 4),
+            'preview': previews[related_id].preview,
+            'created_at': previews[related_id].created_at.isoformat(),
+            'material_url': url_for('.view_material', material_id=related_id)
+        }
+        # 索引中的资料在数据库里已不存在时跳过
+        for related_id, score in related if related_id in previews
+    ])
+
+
+@bp.route('/api/stats', methods=['GET'])
 def api_get_stats():
     """API endpoint to get usage statistics"""
     stats = DatabaseManager.get_interaction_stats()
+    buffer = DatabaseManager.interaction_buffer()
+    if buffer is not None:
+        stats['interaction_buffer'] = buffer.stats()
     return jsonify(stats)
 
 
-@app.route('/api/interaction', methods=['POST'])
+@bp.route('/api/interaction', methods=['POST'])
 def api_log_interaction():
     """API endpoint to log user interactions"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
@@ -164,6 +527,14 @@ def api_log_interaction():
         if not material_id or not interaction_type:
             return jsonify({'error': 'Missing required fields'}), 400
 
+        # 复习结果供间隔重复调度使用，需要卡片序号和 0-5 的评分
+        if interaction_type == 'review':
+            card_index = data.get('card_index')
+            quality = data.get('quality')
+            if not isinstance(card_index, int) or card_index < 0 \
+                    or not isinstance(quality, int) or not 0 <= quality <= 5:
+                return jsonify({'error': 'Review interactions need card_index and a quality from 0 to 5'}), 400
+
         # Log the interaction
         DatabaseManager.log_interaction(material_id, interaction_type, data)
 
@@ -173,67 +544,121 @@ def api_log_interaction():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/material/<int:material_id>', methods=['GET'])
+@bp.route('/api/export/<any(materials, interactions):table>', methods=['GET'])
+def api_export(table):
+    """API endpoint to stream materials or interactions as NDJSON"""
+    try:
+        since = request.args.get('since', None)
+        until = request.args.get('until', None)
+        since = datetime.fromisoformat(since) if since else None
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+
+    chunks = export_ndjson(table, request.args.get('subject', None), since, until)
+    return Response(stream_with_context(chunks), mimetype='application/x-ndjson')
+
+
+@bp.route('/material/<int:material_id>', methods=['GET'])
 def view_material(material_id):
     """View a previously processed material"""
-    material = DatabaseManager.get_material_by_id(material_id)
-    if not material:
+    version = DatabaseManager.get_material_version(material_id)
+    if not version:
         return render_template('cognigrasp_index.html', error="Material not found.")
 
     # Log the view interaction
     DatabaseManager.log_interaction(material_id, "view")
 
-    return render_template('cognigrasp_results.html',
-                           summary=material.summary,
-                           flashcards=json.loads(material.flashcards),
-                           subject=material.subject,
-                           review_dates=json.loads(material.review_dates),
-                           original_input=material.input_text,
-                           material_id=material_id)
+    etag = _material_etag(version, prefix='material-page')
+    max_age = current_app.config['MATERIAL_CACHE_MAX_AGE']
+    not_modified = _not_modified(etag, max_age)
+    if not_modified:
+        return not_modified
 
-
-@app.route('/api/subject-configs', methods=['GET'])
+    material = DatabaseManager.get_material_by_id(material_id)
+    with phase('render'):
+        page = render_template('cognigrasp_results.html',
+                               summary=material.rendered_summary(),
+                               flashcards=material.rendered_flashcards(),
+                               subject=material.subject,
+                               review_dates=material.review_dates,
+                               original_input=material.input_text,
+                               material_id=material_id)
+    return _with_cache_headers(current_app.response_class(page), etag, max_age)
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, SQL and phase timings of this worker process in Prometheus text format"""
+    request_metrics = get_metrics()
+    if request_metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return current_app.response_class(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/api/subject-configs', methods=['GET'])
 def api_get_subject_configs():
     """API endpoint to get all subject configurations"""
+    count, last_updated = DatabaseManager.get_subject_configs_version()
+    etag = f'subject-configs-{count}-{last_updated:%Y%m%d%H%M%S%f}' if last_updated else 'subject-configs-empty'
+    max_age = current_app.config['SUBJECT_CONFIG_CACHE_MAX_AGE']
+    not_modified = _not_modified(etag, max_age)
+    if not_modified:
+        return not_modified
+
     configs = SubjectConfig.query.all()
-    return jsonify([config.to_dict() for config in configs])
+    return _with_cache_headers(jsonify([config.to_dict() for config in configs]), etag, max_age)
 
 
-@app.route('/api/subject-configs/<string:subject_name>', methods=['GET'])
+@bp.route('/api/subject-configs/<string:subject_name>', methods=['GET'])
 def api_get_subject_config(subject_name):
     """API endpoint to get a specific subject configuration"""
-    config = SubjectConfig.query.filter_by(subject_name=subject_name).first()
-    if not config:
+    version = DatabaseManager.get_subject_config_version(subject_name)
+    if not version:
         return jsonify({'error': 'Subject configuration not found'}), 404
 
-    return jsonify(config.to_dict())
+    etag = _subject_config_etag(version)
+    max_age = current_app.config['SUBJECT_CONFIG_CACHE_MAX_AGE']
+    not_modified = _not_modified(etag, max_age)
+    if not_modified:
+        return not_modified
+
+    config = SubjectConfig.query.get(version.id)
+    return _with_cache_headers(jsonify(config.to_dict()), etag, max_age)
 
 
-@app.route('/api/subject-configs/<string:subject_name>', methods=['PUT'])
+@bp.route('/api/subject-configs/<string:subject_name>', methods=['PUT'])
 def api_update_subject_config(subject_name):
     """API endpoint to update a subject configuration"""
     try:
-        config = SubjectConfig.query.filter_by(subject_name=subject_name).first()
-        if not config:
-            return jsonify({'error': 'Subject configuration not found'}), 404
-
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        if 'summary_template' in data:
-            config.summary_template = data['summary_template']
-        if 'flashcards' in data:
-            config.flashcards = json.dumps(data['flashcards'])
-        if 'variations' in data:
-            config.variations = json.dumps(data['variations'])
+        if not DatabaseManager.update_subject_config(subject_name, data):
+            return jsonify({'error': 'Subject configuration not found'}), 404
 
-        db.session.commit()
         return jsonify({'status': 'success', 'message': 'Subject configuration updated'})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def create_app(config=Config):
+    """Application factory. Does no database I/O; run `flask init-db` to create and seed the schema."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    DatabaseManager.init_app(app)
+    init_metrics(app)
+    register_export_commands(app)
+    app.register_blueprint(bp)
+    return app
+
+
+# gunicorn cognigrasp_app:app 和 flask --app cognigrasp_app 使用的实例
+app = create_app()
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -2,24 +2,15 @@ from flask import Flask, render_template, request
 import random
 import re
 from datetime import datetime, timedelta
+from classifier import subject_classifier
 
 app = Flask(__name__)
 
 
 # 模拟不同学科的知识处理
 def generate_ai_response(text):
-    text_lower = text.lower()
-
     # 检测学科类型
-    subject = "general"
-    if any(word in text_lower for word in ["math", "calculate", "equation", "algebra", "calculus"]):
-        subject = "math"
-    elif any(word in text_lower for word in ["history", "war", "king", "century", "ancient"]):
-        subject = "history"
-    elif any(word in text_lower for word in ["science", "physics", "chemistry", "biology", "atom"]):
-        subject = "science"
-    elif any(word in text_lower for word in ["programming", "code", "python", "java", "algorithm"]):
-        subject = "programming"
+    subject = subject_classifier.classify(text)
 
     # 根据学科生成不同的摘要和闪卡
     if subject == "math":
@@ -1,5 +1,87 @@
 import os
 
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+
+# 类属性在导入时读取环境变量，必须先加载 .env
+load_dotenv()
+
+
+def _sqlite_memory(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri):
+    """create_engine() options for the database at `uri`, used by create_app()"""
+    options = {
+        # 连接在池中闲置后可能已被服务器断开，取用前先检查
+        'pool_pre_ping': True
+    }
+    # 内存 SQLite 使用单连接的 StaticPool，不接受连接池大小参数
+    if not _sqlite_memory(uri):
+        options.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30))
+        })
+    return options
+
+
 class Config:
+    # 从环境变量获取配置，否则使用默认值
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///cognigrasp.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLALCHEMY_ENGINE_OPTIONS 默认由 create_app() 按最终的 SQLALCHEMY_DATABASE_URI 计算（见 engine_options），
+    # 子类只改数据库地址时连接池参数也随之匹配
+    # 每个 SQLite 连接建立时执行的 PRAGMA。WAL 模式下读不会被写阻塞，
+    # busy_timeout 让写等待锁而不是立即报 "database is locked"
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # 负数表示 KiB，即 64 MiB
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    }
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
+    # 请求体大小上限（字节），超出时直接返回 413
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+    # 表单文本框提交的内容上限；更大的文档请用文件上传
+    MAX_FORM_MEMORY_SIZE = int(os.environ.get('MAX_FORM_MEMORY_SIZE', 1024 * 1024))
+    # 单个上传文档的大小上限
+    MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 16 * 1024 * 1024))
+    # 长文档分段并行分析：进程池大小（默认 CPU 核数）、整篇文档的超时（秒）、每段目标字符数，
+    # 以及使用进程池的最小文档长度（更短的文档直接计算更快）
+    SECTION_POOL_WORKERS = int(os.environ['SECTION_POOL_WORKERS']) if os.environ.get('SECTION_POOL_WORKERS') else None
+    SECTION_TIMEOUT = float(os.environ.get('SECTION_TIMEOUT', 10.0))
+    SECTION_TARGET_CHARS = int(os.environ.get('SECTION_TARGET_CHARS', 20000))
+    SECTION_POOL_MIN_CHARS = int(os.environ.get('SECTION_POOL_MIN_CHARS', 1024 * 1024))
+    # 异步任务：最大尝试次数、重试退避基数（秒）、worker 失联后任务可被重新领取的租期（秒）
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 5))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    # 批量处理接口单次请求允许的最大文档数
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))
+    # 学科配置缓存版本检查的最小间隔（秒），0 表示每次都检查
+    SUBJECT_CONFIG_CHECK_INTERVAL = float(os.environ.get('SUBJECT_CONFIG_CHECK_INTERVAL', 0))
+    # 条件请求的缓存时间（秒）。资料内容不可变，但被缓存命中的浏览不会记录交互，
+    # 所以默认要求客户端每次用 ETag 重新验证
+    MATERIAL_CACHE_MAX_AGE = int(os.environ.get('MATERIAL_CACHE_MAX_AGE', 0))
+    SUBJECT_CONFIG_CACHE_MAX_AGE = int(os.environ.get('SUBJECT_CONFIG_CACHE_MAX_AGE', 60))
+    # 资料存储方式：template 只记录学科配置版本和变体序号，copy 复制完整的摘要和闪卡文本
+    MATERIAL_STORAGE_MODE = os.environ.get('MATERIAL_STORAGE_MODE', 'template')
+    # /metrics 请求计时和 SQL 统计；超过 SLOW_REQUEST_SECONDS 的请求写警告日志（0 表示关闭）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+    # 相关资料的 TF-IDF 索引：快照目录（默认在 instance 目录下）、检查新快照和新资料的最小间隔（秒）、
+    # 每次查询使用的权重最高的词数、每个词最多读取的倒排项数（越大越准确，也越慢）
+    RELATED_INDEX_PATH = os.environ.get('RELATED_INDEX_PATH')
+    RELATED_INDEX_REFRESH_INTERVAL = float(os.environ.get('RELATED_INDEX_REFRESH_INTERVAL', 1.0))
+    RELATED_MAX_QUERY_TERMS = int(os.environ.get('RELATED_MAX_QUERY_TERMS', 32))
+    RELATED_MAX_POSTINGS = int(os.environ.get('RELATED_MAX_POSTINGS', 2000))
+    # 交互日志异步批量写入（默认关闭）
+    INTERACTION_BUFFER_ENABLED = os.environ.get('INTERACTION_BUFFER_ENABLED', 'False').lower() == 'true'
+    INTERACTION_BUFFER_MAX_SIZE = int(os.environ.get('INTERACTION_BUFFER_MAX_SIZE', 10000))
+    INTERACTION_BUFFER_BATCH_SIZE = int(os.environ.get('INTERACTION_BUFFER_BATCH_SIZE', 500))
+    INTERACTION_BUFFER_FLUSH_INTERVAL = float(os.environ.get('INTERACTION_BUFFER_FLUSH_INTERVAL', 1.0))
@@ -1,14 +1,19 @@
 import pytest
-from cognigrasp_demo import app as flask_app, db
-from models import StudyMaterial, UserInteraction, SubjectConfig
+from cognigrasp_app import create_app
+from config import Config
+from models import db, StudyMaterial, UserInteraction, SubjectConfig
 import json
 
 
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
+
 @pytest.fixture
 def app():
-    flask_app.config['TESTING'] = True
-    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # 每个测试使用新的应用和新的内存数据库
+    flask_app = create_app(TestingConfig)
 
     with flask_app.app_context():
         db.create_all()
@@ -18,8 +23,8 @@ def app():
             input_text="Test input text",
             subject="math",
             summary="Test summary",
-            flashcards=json.dumps(["Flashcard 1", "Flashcard 2"]),
-            review_dates=json.dumps(["2023-01-01 10:00", "2023-01-02 10:00"])
+            flashcards=["Flashcard 1", "Flashcard 2"],
+            review_dates=["2023-01-01 10:00", "2023-01-02 10:00"]
         )
         db.session.add(test_material)
 
@@ -27,8 +32,8 @@ def app():
         math_config = SubjectConfig(
             subject_name="math",
             summary_template="Math summary template",
-            flashcards=json.dumps(["Math flashcard 1", "Math flashcard 2"]),
-            variations=json.dumps(["Math variation 1", "Math variation 2"])
+            flashcards=["Math flashcard 1", "Math flashcard 2"],
+            variations=["Math variation 1", "Math variation 2"]
         )
         db.session.add(math_config)
 
@@ -42,4 +47,4 @@ def app():
 
 @pytest.fixture
 def client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
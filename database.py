@@ -1,20 +1,411 @@
+import click
 from flask import current_app
-from models import db, StudyMaterial, UserInteraction, SubjectConfig
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, StudyMaterial, UserInteraction, SubjectConfig, StatCounter, ProcessingJob, ReviewDate
+from models import SubjectConfigVersion, ReviewCard, sqlite_has_fts5
+from interaction_buffer import InteractionBuffer
+from collections import Counter, namedtuple
+import base64
+import binascii
+import hashlib
 import json
 from datetime import datetime, timedelta
-import random
+import time
+import weakref
+
+# generate_review_dates() 输出的时间格式
+REVIEW_DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run `PRAGMA name=value` for every pragma on each new connection of a SQLite engine"""
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def content_hash(text):
+    """Hash of the text with case and whitespace normalized, used as the result cache key"""
+    normalized = ' '.join(text.split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _counter_deltas(materials=(), interactions=()):
+    """Counter increments for newly inserted materials and interactions"""
+    deltas = Counter()
+    for subject in materials:
+        deltas[('total', 'materials')] += 1
+        deltas[('subject', subject)] += 1
+    for interaction_type in interactions:
+        deltas[('total', 'interactions')] += 1
+        deltas[('interaction_type', interaction_type)] += 1
+    return deltas
+
+
+def _bump_counters(connection, deltas):
+    """Add `deltas` to stat_counters using the connection's current transaction"""
+    rows = [{'scope': scope, 'key': key, 'count': count} for (scope, key), count in deltas.items()]
+    if not rows:
+        return
+
+    table = StatCounter.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={'count': table.c.count + stmt.excluded['count']}
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            table.update()
+            .where(table.c.scope == row['scope'], table.c.key == row['key'])
+            .values(count=table.c.count + row['count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+
+def upsert_rows(connection, table, rows, key_columns):
+    """Insert rows, overwriting the non-key columns of rows whose key already exists"""
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key_columns],
+            set_={name: stmt.excluded[name] for name in rows[0] if name not in key_columns}
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        key = [table.c[name] == row[name] for name in key_columns]
+        result = connection.execute(table.update().where(*key).values(row))
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+
+def parse_review_dates(review_dates):
+    """(position, datetime) pairs for a material's review_dates, skipping entries that do not parse"""
+    if isinstance(review_dates, str):
+        # 旧数据中可能是重复编码的 JSON 文本
+        try:
+            review_dates = json.loads(review_dates)
+        except ValueError:
+            return []
+    if not isinstance(review_dates, list):
+        return []
+
+    parsed = []
+    for position, value in enumerate(review_dates):
+        try:
+            parsed.append((position, datetime.strptime(value, REVIEW_DATE_FORMAT)))
+        except (TypeError, ValueError):
+            try:
+                parsed.append((position, datetime.fromisoformat(value)))
+            except (TypeError, ValueError):
+                continue
+    return parsed
+
+
+def search_match_query(text):
+    """FTS5 MATCH expression requiring every word of `text`; a trailing * on a word matches it as a prefix.
+
+    Words are quoted so user input never reaches the FTS5 query syntax. Returns None when there is nothing to search.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if not any(char.isalnum() for char in word):
+            continue
+        terms.append('"%s"%s' % (word.replace('"', '""'), '*' if prefix else ''))
+    return ' '.join(terms) or None
+
+
+SearchResult = namedtuple('SearchResult', 'id rank snippet subject created_at')
+
+# 从渲染视图读取并写入全文索引；外部内容表写入的内容必须与视图一致，才能正确生成摘录
+_INDEX_MATERIALS_SQL = (
+    'INSERT INTO material_search(rowid, input_text, summary) '
+    'SELECT id, input_text, summary FROM material_search_content WHERE {condition}'
+)
+
+
+def _review_date_rows(material_id, review_dates):
+    return [
+        {'material_id': material_id, 'position': position, 'due_at': due_at}
+        for position, due_at in parse_review_dates(review_dates)
+    ]
+
+
+SUBJECT_CONFIG_CONTENT = ('summary_template', 'flashcards', 'variations')
+
+
+@event.listens_for(db.session, 'before_flush')
+def _snapshot_subject_configs(session, flush_context, instances):
+    """Record a new immutable SubjectConfigVersion whenever a config's content is written"""
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, SubjectConfig):
+            continue
+        state = db.inspect(obj)
+        if not state.pending and not any(state.attrs[name].history.has_changes()
+                                         for name in SUBJECT_CONFIG_CONTENT):
+            continue
+        obj.version = (obj.version or 0) + 1
+        session.add(SubjectConfigVersion(
+            subject_config=obj,
+            version=obj.version,
+            summary_template=obj.summary_template,
+            flashcards=list(obj.flashcards),
+            variations=list(obj.variations)
+        ))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _index_flushed_review_dates(session, flush_context):
+    """Mirror review_dates of materials inserted through the ORM into the review_dates table"""
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, StudyMaterial):
+            rows.extend(_review_date_rows(obj.id, obj.review_dates))
+    if rows:
+        session.connection().execute(ReviewDate.__table__.insert(), rows)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _index_flushed_materials(session, flush_context):
+    """Add materials inserted through the ORM to the SQLite full-text index"""
+    ids = [obj.id for obj in session.new if isinstance(obj, StudyMaterial)]
+    connection = session.connection()
+    if ids and DatabaseManager.search_available(connection):
+        connection.execute(
+            db.text(_INDEX_MATERIALS_SQL.format(condition='id IN :ids')).bindparams(
+                db.bindparam('ids', expanding=True)),
+            {'ids': ids})
+
+
+@event.listens_for(db.metadata, 'after_create')
+@event.listens_for(db.metadata, 'before_drop')
+def _forget_search_index(target, connection, **kw):
+    """create_all / drop_all may add or remove material_search; check again on next use"""
+    DatabaseManager._search_available.pop(connection.engine, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_flushed_rows(session, flush_context):
+    """Keep stat_counters in step with rows inserted through the ORM"""
+    new = list(session.new)
+    deltas = _counter_deltas(
+        materials=[obj.subject for obj in new if isinstance(obj, StudyMaterial)],
+        interactions=[obj.interaction_type for obj in new if isinstance(obj, UserInteraction)]
+    )
+    # 加上 get_cached_result() 记在会话里、尚未写入的计数
+    deltas.update(session.info.pop('counter_deltas', {}))
+    _bump_counters(session.connection(), deltas)
 
 
 class DatabaseManager:
     @staticmethod
     def init_app(app):
         db.init_app(app)
+        if app.config.get('INTERACTION_BUFFER_ENABLED'):
+            app.extensions['interaction_buffer'] = InteractionBuffer(
+                app,
+                DatabaseManager.insert_interactions,
+                max_size=app.config.get('INTERACTION_BUFFER_MAX_SIZE', 10000),
+                batch_size=app.config.get('INTERACTION_BUFFER_BATCH_SIZE', 500),
+                flush_interval=app.config.get('INTERACTION_BUFFER_FLUSH_INTERVAL', 1.0)
+            )
+        # 这里不访问数据库：建表和初始数据由 flask init-db 完成，
+        # 应用可以在 gunicorn --preload 的主进程中创建后再 fork
         with app.app_context():
+            if db.engine.dialect.name == 'sqlite' and app.config.get('SQLITE_PRAGMAS'):
+                # 在任何连接建立之前注册，连接池中的每个连接都会执行
+                apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        DatabaseManager.invalidate_subject_config_cache()
+
+        @app.cli.command('init-db')
+        @click.option('--sample-data/--no-sample-data', default=True,
+                      help='Add the demo materials when the database has none.')
+        def init_db_command(sample_data):
+            """Create and upgrade the schema and seed subject configs; safe to re-run."""
+            DatabaseManager.init_db(sample_data=sample_data)
+            print('Database initialized.')
+
+        @app.cli.command('upgrade-db')
+        def upgrade_db_command():
+            """Bring an existing database up to the current schema."""
+            # 先建出旧数据库还没有的表，upgrade_schema() 再处理已有表
             db.create_all()
-            # Initialize with sample data if needed
-            DatabaseManager._init_subject_configs()
-            if not StudyMaterial.query.first():
+            DatabaseManager.upgrade_schema()
+            print('Database schema is up to date.')
+
+        @app.cli.command('rebuild-stats')
+        def rebuild_stats_command():
+            """Recompute the /api/stats counters from the raw tables."""
+            DatabaseManager.rebuild_stat_counters()
+            print('Stat counters rebuilt.')
+
+        @app.cli.command('backfill-review-dates')
+        def backfill_review_dates_command():
+            """Fill the review_dates table from materials that have no rows there yet."""
+            added = DatabaseManager.backfill_review_dates()
+            print(f'Added {added} review date(s).')
+
+        @app.cli.command('backfill-search-index')
+        def backfill_search_index_command():
+            """Add materials that are missing from the full-text search index."""
+            if not DatabaseManager.search_available():
+                print('Full-text search needs SQLite FTS5; nothing to do.')
+                return
+            added = DatabaseManager.backfill_search_index()
+            print(f'Indexed {added} material(s).')
+
+        @app.cli.command('compact-materials')
+        def compact_materials_command():
+            """Replace copied summary/flashcards text with references to subject config versions."""
+            compacted = DatabaseManager.compact_materials()
+            if db.engine.dialect.name == 'sqlite':
+                # SQLite 删除数据后文件不会变小，需要 VACUUM 回收空间
+                with db.engine.connect() as conn:
+                    conn.exec_driver_sql('VACUUM')
+            print(f'Compacted {compacted} material(s).')
+
+    @staticmethod
+    def init_db(sample_data=True):
+        """Create missing tables, apply upgrades and seed initial data; run once per deploy"""
+        db.create_all()
+        DatabaseManager.upgrade_schema()
+        DatabaseManager._init_subject_configs()
+        DatabaseManager._snapshot_legacy_subject_configs()
+        if not StudyMaterial.query.first():
+            if sample_data:
                 DatabaseManager._add_sample_data()
+        elif not StatCounter.query.first():
+            # 已有数据但计数表为空（旧数据库升级），从原始表重建
+            DatabaseManager.rebuild_stat_counters()
+        if not ReviewDate.query.first():
+            # 旧数据库升级：从 review_dates 列回填复习时间表
+            DatabaseManager.backfill_review_dates()
+        if DatabaseManager.search_available() and not db.session.execute(
+                db.text('SELECT 1 FROM material_search_docsize LIMIT 1')).first():
+            # 旧数据库升级：索引为空时为已有资料建立全文索引
+            DatabaseManager.backfill_search_index()
+
+    @staticmethod
+    def upgrade_schema():
+        """Apply schema changes that create_all() skips on existing tables; safe to re-run"""
+        # 已有表上新增的（可为空的）列
+        inspector = db.inspect(db.engine)
+        added = set()
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing and column.nullable:
+                        column_type = column.type.compile(dialect=db.engine.dialect)
+                        conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                        added.add((table.name, column.name))
+
+            if ('user_interactions', 'scheduled_at') in added:
+                # 之前的调度器按 review_cards.last_interaction_id 记录进度，
+                # 这之前的复习已经应用过，标记掉以免重复应用
+                conn.exec_driver_sql(
+                    "UPDATE user_interactions SET scheduled_at = CURRENT_TIMESTAMP "
+                    "WHERE interaction_type = 'review' "
+                    "AND id <= (SELECT COALESCE(MAX(last_interaction_id), 0) FROM review_cards)")
+
+        # 模型中改为可为空的列（例如按模板存储后的 summary / flashcards）
+        for table in db.metadata.sorted_tables:
+            columns = {column['name']: column for column in inspector.get_columns(table.name)}
+            relaxed = [column.name for column in table.columns
+                       if column.nullable and not column.primary_key
+                       and column.name in columns and not columns[column.name]['nullable']]
+            if relaxed:
+                DatabaseManager._drop_not_null(table, relaxed, columns)
+
+        # create_all() 只建缺失的表，已有表上新增的索引需要单独创建
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+
+        # flashcards / review_dates / variations 从 Text 改为 JSON 列。
+        # SQLite 中原有的值就是 json.dumps 的文本，JSON 类型可直接读取，无需改写；
+        # PostgreSQL 需要把列类型转换为 json。
+        if db.engine.dialect.name == 'postgresql':
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column in (('study_materials', 'flashcards'),
+                                      ('study_materials', 'review_dates'),
+                                      ('subject_configs', 'flashcards'),
+                                      ('subject_configs', 'variations')):
+                    column_types = {c['name']: c['type'] for c in inspector.get_columns(table)}
+                    if isinstance(column_types[column], db.Text):
+                        conn.exec_driver_sql(
+                            f'ALTER TABLE {table} ALTER COLUMN {column} TYPE JSON USING {column}::json')
+
+    @staticmethod
+    def _drop_not_null(table, column_names, existing_columns):
+        """Drop NOT NULL from existing columns; SQLite cannot alter a column, so the table is rebuilt"""
+        if db.engine.dialect.name != 'sqlite':
+            with db.engine.begin() as conn:
+                for name in column_names:
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ALTER COLUMN {name} DROP NOT NULL')
+            return
+
+        # 按当前模型建新表、复制数据、删除旧表后改名；索引由后面的 index.create 重新创建。
+        # 其他模型一并复制进临时 MetaData，新表的外键才能解析。
+        scratch = db.MetaData()
+        for other in db.metadata.sorted_tables:
+            if other is not table:
+                other.to_metadata(scratch)
+        rebuilt = table.to_metadata(scratch, name=f'{table.name}_rebuild')
+        for index in list(rebuilt.indexes):
+            rebuilt.indexes.discard(index)
+        copied = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+        with db.engine.begin() as conn:
+            conn.execute(db.schema.CreateTable(rebuilt))
+            conn.exec_driver_sql(
+                f'INSERT INTO {rebuilt.name} ({copied}) SELECT {copied} FROM {table.name}')
+            conn.exec_driver_sql(f'DROP TABLE {table.name}')
+            # 引用原表的视图（material_search_content）此时暂时失效，
+            # 新版 SQLite 改名时会检查视图并报错，用旧的改名行为跳过检查
+            conn.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+            conn.exec_driver_sql(f'ALTER TABLE {rebuilt.name} RENAME TO {table.name}')
+            conn.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+
+    @staticmethod
+    def _snapshot_legacy_subject_configs():
+        """Give configs from before versioning their first SubjectConfigVersion"""
+        configs = SubjectConfig.query.filter(SubjectConfig.version.is_(None)).all()
+        if not configs:
+            return
+        for config in configs:
+            db.session.add(SubjectConfigVersion(
+                subject_config_id=config.id,
+                version=1,
+                summary_template=config.summary_template,
+                flashcards=config.flashcards,
+                variations=config.variations
+            ))
+        # 直接写入 updated_at 原值，避免 onupdate 让 ETag 和结果缓存失效
+        table = SubjectConfig.__table__
+        db.session.execute(table.update().where(table.c.version.is_(None)).values(
+            version=1, updated_at=table.c.updated_at))
+        db.session.commit()
 
     @staticmethod
     def _init_subject_configs():
@@ -100,8 +491,8 @@ class DatabaseManager:
             subject_config = SubjectConfig(
                 subject_name=config['subject_name'],
                 summary_template=config['summary_template'],
-                flashcards=json.dumps(config['flashcards']),
-                variations=json.dumps(config['variations'])
+                flashcards=config['flashcards'],
+                variations=config['variations']
             )
             db.session.add(subject_config)
 
@@ -150,62 +541,490 @@ class DatabaseManager:
                 input_text=data['input_text'],
                 subject=data['subject'],
                 summary=data['summary'],
-                flashcards=json.dumps(data['flashcards']),
-                review_dates=json.dumps(data['review_dates'])
+                flashcards=data['flashcards'],
+                review_dates=data['review_dates']
             )
             db.session.add(material)
 
         db.session.commit()
 
+    # 每个 worker 进程内的学科配置缓存
+    _subject_config_cache = None
+    _subject_config_stamp = None
+    _subject_config_checked_at = 0.0
+
     @staticmethod
-    def get_subject_config(subject_name):
-        """Get configuration for a specific subject"""
-        config = SubjectConfig.query.filter_by(subject_name=subject_name).first()
-        if config:
-            return {
+    def get_subject_configs_version():
+        """Cheap version stamp of the subject_configs table.
+
+        Any insert, update or delete changes the row count or the newest
+        updated_at, so other workers notice a PUT without reloading every row.
+        """
+        count, last_updated = db.session.query(
+            db.func.count(SubjectConfig.id),
+            db.func.max(SubjectConfig.updated_at)
+        ).one()
+        return count, last_updated
+
+    @staticmethod
+    def _load_subject_configs():
+        """Decode every subject configuration once, with the id of its current SubjectConfigVersion"""
+        rows = db.session.query(SubjectConfig, SubjectConfigVersion.id).outerjoin(
+            SubjectConfigVersion,
+            (SubjectConfigVersion.subject_config_id == SubjectConfig.id)
+            & (SubjectConfigVersion.version == SubjectConfig.version)
+        ).all()
+        return {
+            config.subject_name: {
                 'summary_template': config.summary_template,
-                'flashcards': json.loads(config.flashcards),
-                'variations': json.loads(config.variations)
+                'flashcards': config.flashcards,
+                'variations': config.variations,
+                'version_id': version_id
             }
+            for config, version_id in rows
+        }
+
+    @staticmethod
+    def get_subject_configs():
+        """Get all decoded subject configurations, reloading only when the version changes"""
+        cache = DatabaseManager._subject_config_cache
+        interval = current_app.config.get('SUBJECT_CONFIG_CHECK_INTERVAL', 0)
+        now = time.monotonic()
+        if cache is not None and now - DatabaseManager._subject_config_checked_at < interval:
+            return cache
+
+        stamp = DatabaseManager.get_subject_configs_version()
+        if cache is None or stamp != DatabaseManager._subject_config_stamp:
+            cache = DatabaseManager._load_subject_configs()
+            DatabaseManager._subject_config_cache = cache
+            DatabaseManager._subject_config_stamp = stamp
+        DatabaseManager._subject_config_checked_at = now
+        return cache
+
+    @staticmethod
+    def invalidate_subject_config_cache():
+        """Drop this worker's cached subject configurations"""
+        DatabaseManager._subject_config_cache = None
+        DatabaseManager._subject_config_stamp = None
+
+    @staticmethod
+    def get_subject_config(subject_name):
+        """Get configuration for a specific subject"""
+        configs = DatabaseManager.get_subject_configs()
         # Fallback to general if subject not found
-        general_config = SubjectConfig.query.filter_by(subject_name='general').first()
-        if general_config:
+        config = configs.get(subject_name) or configs.get('general')
+        if config:
+            # 返回副本，调用方修改列表不会影响缓存
             return {
-                'summary_template': general_config.summary_template,
-                'flashcards': json.loads(general_config.flashcards),
-                'variations': json.loads(general_config.variations)
+                'summary_template': config['summary_template'],
+                'flashcards': list(config['flashcards']),
+                'variations': list(config['variations'])
             }
         return None
 
     @staticmethod
-    def save_material(input_text, subject, summary, flashcards, review_dates):
-        """Save processed study material to database"""
-        material = StudyMaterial(
+    def get_subject_config_version(subject_name):
+        """(id, updated_at) of a subject configuration without loading it, or None"""
+        return db.session.query(SubjectConfig.id, SubjectConfig.updated_at).filter_by(
+            subject_name=subject_name).first()
+
+    @staticmethod
+    def update_subject_config(subject_name, data):
+        """Update a subject configuration and invalidate the cache; returns False if not found"""
+        config = SubjectConfig.query.filter_by(subject_name=subject_name).first()
+        if not config:
+            return False
+
+        if 'summary_template' in data:
+            config.summary_template = data['summary_template']
+        if 'flashcards' in data:
+            config.flashcards = data['flashcards']
+        if 'variations' in data:
+            config.variations = data['variations']
+        # 即使内容未变也更新时间戳，让其他 worker 的版本检查能发现这次写入
+        config.updated_at = datetime.utcnow()
+
+        db.session.commit()
+        DatabaseManager.invalidate_subject_config_cache()
+        return True
+
+    @staticmethod
+    def get_cached_result(digest):
+        """Analysis of an earlier material with the same content hash, or None.
+
+        Results stored before the last subject config change are ignored. The
+        lookup only reads: the hit or miss is kept in the session and added to
+        stat_counters by the flush that saves the caller's material.
+        """
+        _, configs_updated = DatabaseManager.get_subject_configs_version()
+        query = StudyMaterial.query.options(db.load_only(
+            StudyMaterial.subject, StudyMaterial.summary, StudyMaterial.flashcards,
+            StudyMaterial.config_version_id, StudyMaterial.variation_index
+        )).filter(StudyMaterial.content_hash == digest)
+        if configs_updated:
+            query = query.filter(StudyMaterial.processed_at >= configs_updated)
+        row = query.order_by(StudyMaterial.id.desc()).first()
+
+        # 这里不写库，否则 SQLite 的写锁会在整个分析期间被占用
+        pending = db.session.info.setdefault('counter_deltas', Counter())
+        pending[('result_cache', 'hits' if row else 'misses')] += 1
+        if not row:
+            return None
+        return {'subject': row.subject, 'summary': row.rendered_summary(), 'flashcards': row.rendered_flashcards()}
+
+    @staticmethod
+    def _template_reference(subject, summary, flashcards):
+        """(config_version_id, variation_index) that renders exactly this summary and flashcards, or None"""
+        if current_app.config.get('MATERIAL_STORAGE_MODE', 'template') != 'template':
+            return None
+        config = DatabaseManager.get_subject_configs().get(subject)
+        # 内容与当前配置快照不一致（例如使用了默认配置）时照常复制文本
+        if not config or config['version_id'] is None or flashcards != config['flashcards']:
+            return None
+        prefix = config['summary_template'] + '\n\n'
+        if not summary.startswith(prefix):
+            return None
+        try:
+            return config['version_id'], config['variations'].index(summary[len(prefix):])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _new_material(input_text, subject, summary, flashcards, review_dates, content_hash):
+        reference = DatabaseManager._template_reference(subject, summary, flashcards)
+        if reference:
+            config_version_id, variation_index = reference
+            summary = flashcards = None
+        else:
+            config_version_id = variation_index = None
+        return StudyMaterial(
             input_text=input_text,
             subject=subject,
             summary=summary,
-            flashcards=json.dumps(flashcards),
-            review_dates=json.dumps(review_dates)
+            flashcards=flashcards,
+            review_dates=review_dates,
+            content_hash=content_hash,
+            config_version_id=config_version_id,
+            variation_index=variation_index
         )
+
+    @staticmethod
+    def save_material(input_text, subject, summary, flashcards, review_dates, content_hash=None):
+        """Save processed study material to database"""
+        material = DatabaseManager._new_material(
+            input_text, subject, summary, flashcards, review_dates, content_hash)
         db.session.add(material)
         db.session.commit()
         return material.id
 
+    @staticmethod
+    def save_materials(results, interaction_type="process"):
+        """Save many processed materials plus one interaction each in a single transaction.
+
+        `results` is a list of (input_text, ai_response, content_hash) tuples; returns the new ids in order.
+        """
+        materials = [
+            DatabaseManager._new_material(
+                input_text,
+                ai_response['subject'],
+                ai_response['summary'],
+                ai_response['flashcards'],
+                ai_response['review_dates'],
+                digest
+            )
+            for input_text, ai_response, digest in results
+        ]
+        db.session.add_all(materials)
+        # flush 以批量 INSERT 的方式写入并取回主键
+        db.session.flush()
+
+        db.session.add_all([
+            UserInteraction(material_id=material.id, interaction_type=interaction_type)
+            for material in materials
+        ])
+        db.session.commit()
+        return [material.id for material in materials]
+
+    @staticmethod
+    def interaction_buffer():
+        """The write-behind interaction buffer, or None when logging is synchronous"""
+        return current_app.extensions.get('interaction_buffer')
+
     @staticmethod
     def log_interaction(material_id, interaction_type, interaction_data=None):
         """Log user interaction with study materials"""
-        interaction = UserInteraction(
-            material_id=material_id,
-            interaction_type=interaction_type,
-            interaction_data=json.dumps(interaction_data) if interaction_data else None
-        )
-        db.session.add(interaction)
+        row = {
+            'material_id': material_id,
+            'interaction_type': interaction_type,
+            'interaction_data': json.dumps(interaction_data) if interaction_data else None,
+            'created_at': datetime.utcnow()
+        }
+        buffer = DatabaseManager.interaction_buffer()
+        if buffer is not None:
+            buffer.put(row)
+            return
+
+        DatabaseManager.insert_interactions([row])
+
+    @staticmethod
+    def insert_interactions(rows):
+        """Insert interaction rows in one bulk INSERT and commit"""
+        db.session.execute(db.insert(UserInteraction), rows)
+        # 核心层的批量插入不会触发 ORM flush 事件，这里手动更新计数
+        _bump_counters(db.session.connection(),
+                       _counter_deltas(interactions=[row['interaction_type'] for row in rows]))
         db.session.commit()
 
     @staticmethod
-    def get_recent_materials(limit=10):
+    def encode_material_cursor(material):
+        """Opaque keyset cursor pointing just after `material` in (created_at, id) order"""
+        raw = f'{material.created_at.isoformat()}|{material.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_material_cursor(cursor):
+        """Decode a cursor from encode_material_cursor; raises ValueError if malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, material_id = raw.split('|')
+            return datetime.fromisoformat(created_at), int(material_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+    @staticmethod
+    def _materials_page(query, limit, cursor):
+        """Newest-first page of `query`, continuing after `cursor` if given"""
+        if cursor:
+            created_at, material_id = DatabaseManager.decode_material_cursor(cursor)
+            # 键集分页：按 (created_at, id) 继续，深页与首页代价相同
+            query = query.filter(
+                db.tuple_(StudyMaterial.created_at, StudyMaterial.id) < (created_at, material_id))
+        return query.order_by(StudyMaterial.created_at.desc(), StudyMaterial.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def get_recent_materials(limit=10, cursor=None):
         """Get recently processed materials"""
-        return StudyMaterial.query.order_by(StudyMaterial.created_at.desc()).limit(limit).all()
+        return DatabaseManager._materials_page(StudyMaterial.query, limit, cursor)
+
+    @staticmethod
+    def get_materials_json(subject=None, limit=10, cursor=None):
+        """Page of materials as StudyMaterial.json_columns() rows, for serializing with row_to_json()"""
+        query = db.session.query(*StudyMaterial.json_columns()).outerjoin(StudyMaterial.config_version)
+        if subject:
+            query = query.filter(StudyMaterial.subject == subject)
+        return DatabaseManager._materials_page(query, limit, cursor)
+
+    @staticmethod
+    def backfill_review_dates(batch_size=1000):
+        """Parse review_dates of materials that have no review_dates rows yet; returns rows added"""
+        added = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(StudyMaterial.id, StudyMaterial.review_dates).outerjoin(
+                ReviewDate, ReviewDate.material_id == StudyMaterial.id
+            ).filter(
+                ReviewDate.material_id.is_(None), StudyMaterial.id > last_id
+            ).order_by(StudyMaterial.id).limit(batch_size).all()
+            if not rows:
+                return added
+
+            review_dates = []
+            for material_id, dates in rows:
+                review_dates.extend(_review_date_rows(material_id, dates))
+            if review_dates:
+                db.session.execute(ReviewDate.__table__.insert(), review_dates)
+            db.session.commit()
+            added += len(review_dates)
+            last_id = rows[-1].id
+
+    # {engine: bool}，建表和删表时清空（见 _forget_search_index）
+    _search_available = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def search_available(connection=None):
+        """Whether the database has the FTS5 material search index (SQLite with FTS5 only)"""
+        engine = connection.engine if connection is not None else db.engine
+        available = DatabaseManager._search_available.get(engine)
+        if available is None:
+            if engine.dialect.name != 'sqlite':
+                available = False
+            else:
+                def check(conn):
+                    return sqlite_has_fts5(conn) and conn.exec_driver_sql(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'material_search'"
+                    ).first() is not None
+                if connection is not None:
+                    available = check(connection)
+                else:
+                    with engine.connect() as conn:
+                        available = check(conn)
+            DatabaseManager._search_available[engine] = available
+        return available
+
+    @staticmethod
+    def backfill_search_index(batch_size=1000):
+        """Index materials missing from material_search, e.g. bulk-inserted rows; returns rows indexed"""
+        # material_search_docsize 是 FTS5 的影子表，每个已索引的 rowid 一行
+        missing = ('id > :last_id AND NOT EXISTS '
+                   '(SELECT 1 FROM material_search_docsize d WHERE d.id = study_materials.id)')
+        added = 0
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                db.text(f'SELECT id FROM study_materials WHERE {missing} ORDER BY id LIMIT :limit'),
+                {'last_id': last_id, 'limit': batch_size}).scalars().all()
+            if not ids:
+                return added
+            db.session.execute(
+                db.text(_INDEX_MATERIALS_SQL.format(condition='id BETWEEN :first_id AND :last_id AND NOT EXISTS '
+                        '(SELECT 1 FROM material_search_docsize d WHERE d.id = material_search_content.id)')),
+                {'first_id': ids[0], 'last_id': ids[-1]})
+            db.session.commit()
+            added += len(ids)
+            last_id = ids[-1]
+
+    @staticmethod
+    def encode_search_cursor(result, order='rank'):
+        """Opaque keyset cursor pointing just after `result` in the given search order"""
+        raw = f'{order}|{result.rank!r}|{result.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_search_cursor(cursor, order='rank'):
+        """Decode a cursor from encode_search_cursor for the same order; raises ValueError if malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            cursor_order, rank, material_id = raw.split('|')
+            if cursor_order != order:
+                raise ValueError(cursor_order)
+            return float(rank), int(material_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+    @staticmethod
+    def search_materials(query, limit=10, cursor=None, order='rank'):
+        """Materials matching FTS5 `query` with a snippet of the matching text.
+
+        `order` is 'rank' (bm25, lower is better, best match first) or
+        'newest'. Ranking scores every match, so terms found in a large share
+        of materials are much faster with 'newest', which FTS5 answers by
+        walking its index in rowid order. Pages continue after `cursor`.
+        """
+        params = {'query': query, 'limit': limit}
+        after = ''
+        if cursor:
+            params['rank'], params['id'] = DatabaseManager.decode_search_cursor(cursor, order)
+            if order == 'newest':
+                after = 'AND material_search.rowid < :id'
+            else:
+                after = ('AND (material_search.rank > :rank '
+                         'OR (material_search.rank = :rank AND material_search.rowid > :id))')
+        order_by = 'rowid DESC' if order == 'newest' else 'rank, rowid'
+        # 先只取一页的 rowid 和排名，摘录只为这一页生成（需要从视图读取原文）
+        page = db.session.execute(db.text(
+            f'SELECT rowid AS id, rank FROM material_search WHERE material_search MATCH :query {after} '
+            f'ORDER BY {order_by} LIMIT :limit'), params).all()
+        if not page:
+            return []
+        details = {row.id: row for row in db.session.execute(db.text(
+            "SELECT material_search.rowid AS id, snippet(material_search, -1, '**', '**', '…', 16) AS snippet, "
+            'm.subject, m.created_at FROM material_search JOIN study_materials m ON m.id = material_search.rowid '
+            'WHERE material_search MATCH :query AND material_search.rowid IN :ids').bindparams(
+                db.bindparam('ids', expanding=True)).columns(created_at=db.DateTime),
+            {'query': query, 'ids': [row.id for row in page]})}
+        return [SearchResult(row.id, row.rank, details[row.id].snippet, details[row.id].subject,
+                             details[row.id].created_at) for row in page]
+
+    @staticmethod
+    def compact_materials(batch_size=1000):
+        """Point copied materials at the config version they were rendered from; returns rows compacted.
+
+        A row is only compacted when some stored version of its subject's
+        config renders exactly the same summary and flashcards.
+        """
+        versions = {}
+        for version, subject in db.session.query(SubjectConfigVersion, SubjectConfig.subject_name).join(
+                SubjectConfigVersion.subject_config).order_by(SubjectConfigVersion.version.desc()):
+            versions.setdefault(subject, []).append(version)
+
+        table = StudyMaterial.__table__
+        compacted = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(
+                StudyMaterial.id, StudyMaterial.subject, StudyMaterial.summary, StudyMaterial.flashcards
+            ).filter(
+                StudyMaterial.config_version_id.is_(None), StudyMaterial.id > last_id
+            ).order_by(StudyMaterial.id).limit(batch_size).all()
+            if not rows:
+                return compacted
+
+            updates = []
+            for row in rows:
+                for version in versions.get(row.subject, ()):
+                    prefix = version.summary_template + '\n\n'
+                    if row.flashcards != version.flashcards or not (row.summary or '').startswith(prefix):
+                        continue
+                    try:
+                        variation_index = version.variations.index(row.summary[len(prefix):])
+                    except ValueError:
+                        continue
+                    updates.append({'material_id': row.id, 'version_id': version.id,
+                                    'variation_index': variation_index})
+                    break
+            if updates:
+                db.session.execute(
+                    table.update().where(table.c.id == db.bindparam('material_id')).values(
+                        config_version_id=db.bindparam('version_id'),
+                        variation_index=db.bindparam('variation_index'),
+                        summary=None, flashcards=None),
+                    updates)
+            db.session.commit()
+            compacted += len(updates)
+            last_id = rows[-1].id
+
+    @staticmethod
+    def encode_review_cursor(review_date):
+        """Opaque keyset cursor pointing just after `review_date` in (due_at, material_id, position) order"""
+        raw = f'{review_date.due_at.isoformat()}|{review_date.material_id}|{review_date.position}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_review_cursor(cursor):
+        """Decode a cursor from encode_review_cursor; raises ValueError if malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            due_at, material_id, position = raw.split('|')
+            return datetime.fromisoformat(due_at), int(material_id), int(position)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+    @staticmethod
+    def get_due_reviews(before, limit=50, cursor=None):
+        """Review items due before `before` (naive UTC), soonest first, continuing after `cursor` if given
+
+        Flashcards with SM-2 state come from review_cards (`source` 'card', `position` is the card
+        index); materials without any review card fall back to their fixed review_dates
+        (`source` 'schedule').
+        """
+        after = DatabaseManager.decode_review_cursor(cursor) if cursor else None
+        # 每种资料只出现在其中一个来源，(due_at, material_id, position) 在合并结果中唯一
+        schedule = db.session.query(
+            ReviewDate.material_id, ReviewDate.position, ReviewDate.due_at, db.literal('schedule').label('source')
+        ).filter(ReviewDate.due_at < before, ~db.exists().where(ReviewCard.material_id == ReviewDate.material_id))
+        cards = db.session.query(
+            ReviewCard.material_id, ReviewCard.card_index.label('position'), ReviewCard.due_at,
+            db.literal('card').label('source')
+        ).filter(ReviewCard.due_at < before)
+        if after:
+            # 与 ix_review_dates_due_at / ix_review_cards_due_at 的列顺序一致，只做索引范围扫描
+            schedule = schedule.filter(
+                db.tuple_(ReviewDate.due_at, ReviewDate.material_id, ReviewDate.position) > after)
+            cards = cards.filter(db.tuple_(ReviewCard.due_at, ReviewCard.material_id, ReviewCard.card_index) > after)
+        schedule = schedule.order_by(ReviewDate.due_at, ReviewDate.material_id, ReviewDate.position).limit(limit)
+        cards = cards.order_by(ReviewCard.due_at, ReviewCard.material_id, ReviewCard.card_index).limit(limit)
+        rows = schedule.all() + cards.all()
+        return sorted(rows, key=lambda row: (row.due_at, row.material_id, row.position))[:limit]
 
     @staticmethod
     def get_material_by_id(material_id):
@@ -213,21 +1032,210 @@ class DatabaseManager:
         return StudyMaterial.query.get(material_id)
 
     @staticmethod
-    def get_materials_by_subject(subject, limit=10):
+    def get_material_previews(material_ids, length=200):
+        """{id: row} with subject, created_at and the first `length` characters of input_text"""
+        rows = db.session.query(
+            StudyMaterial.id, StudyMaterial.subject, StudyMaterial.created_at,
+            db.func.substr(StudyMaterial.input_text, 1, length).label('preview')
+        ).filter(StudyMaterial.id.in_(material_ids)).all()
+        return {row.id: row for row in rows}
+
+    @staticmethod
+    def get_material_version(material_id):
+        """(id, processed_at) of a material without loading its content, or None"""
+        return db.session.query(StudyMaterial.id, StudyMaterial.processed_at).filter_by(
+            id=material_id).first()
+
+    @staticmethod
+    def get_materials_by_subject(subject, limit=10, cursor=None):
         """Get materials by subject"""
-        return StudyMaterial.query.filter_by(subject=subject).order_by(
-            StudyMaterial.created_at.desc()).limit(limit).all()
+        return DatabaseManager._materials_page(StudyMaterial.query.filter_by(subject=subject), limit, cursor)
+
+    @staticmethod
+    def iter_materials(subject=None, since=None, until=None, batch_size=1000):
+        """Stream materials in id order, fetching `batch_size` rows at a time"""
+        stmt = db.select(StudyMaterial)
+        if subject:
+            stmt = stmt.where(StudyMaterial.subject == subject)
+        if since:
+            stmt = stmt.where(StudyMaterial.created_at >= since)
+        if until:
+            stmt = stmt.where(StudyMaterial.created_at < until)
+        stmt = stmt.order_by(StudyMaterial.id).execution_options(yield_per=batch_size)
+        return db.session.scalars(stmt)
+
+    @staticmethod
+    def iter_interactions(subject=None, since=None, until=None, batch_size=1000):
+        """Stream interactions in id order; `subject` filters on the material's subject"""
+        stmt = db.select(UserInteraction)
+        if subject:
+            stmt = stmt.join(StudyMaterial, UserInteraction.material_id == StudyMaterial.id).where(
+                StudyMaterial.subject == subject)
+        if since:
+            stmt = stmt.where(UserInteraction.created_at >= since)
+        if until:
+            stmt = stmt.where(UserInteraction.created_at < until)
+        stmt = stmt.order_by(UserInteraction.id).execution_options(yield_per=batch_size)
+        return db.session.scalars(stmt)
+
+    @staticmethod
+    def enqueue_job(input_text, max_attempts=3):
+        """Queue study material for asynchronous processing; returns the job id"""
+        job = ProcessingJob(input_text=input_text, max_attempts=max_attempts)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    @staticmethod
+    def get_job(job_id):
+        """Get job by ID"""
+        return db.session.get(ProcessingJob, job_id)
+
+    @staticmethod
+    def claim_job(worker_id, lease_seconds=300):
+        """Claim the oldest runnable job for `worker_id`, or return None.
+
+        Jobs whose lease was not renewed for `lease_seconds` (their worker died)
+        can be claimed again while they have attempts left, and are marked
+        failed once they do not. The claim is a compare-and-swap on the attempt
+        count, so two workers racing for the same job cannot both win.
+
+        The job is returned detached from the session: its worker_id and
+        attempts keep describing this claim after later commits, and
+        renew_job_lease(), complete_job() and fail_job() only act while the
+        claim is still held.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=lease_seconds)
+        stale = db.and_(ProcessingJob.status == 'running', ProcessingJob.claimed_at < stale_before)
+
+        # 租期过期且没有剩余次数的任务不再领取，直接标记为失败。
+        # 先只读检查：空闲轮询时不获取 SQLite 的写锁
+        exhausted = db.and_(stale, ProcessingJob.attempts >= ProcessingJob.max_attempts)
+        if db.session.query(ProcessingJob.id).filter(exhausted).first() is not None:
+            db.session.execute(
+                db.update(ProcessingJob)
+                .where(exhausted)
+                .values(status='failed', finished_at=now,
+                        error=db.func.coalesce(ProcessingJob.error, 'Worker lost the job on its last attempt'))
+            )
+            db.session.commit()
+
+        while True:
+            candidate = db.session.query(ProcessingJob.id, ProcessingJob.attempts).filter(
+                db.or_(
+                    db.and_(ProcessingJob.status == 'queued', ProcessingJob.available_at <= now),
+                    db.and_(stale, ProcessingJob.attempts < ProcessingJob.max_attempts)
+                )
+            ).order_by(ProcessingJob.id).first()
+            if candidate is None:
+                db.session.rollback()
+                return None
+
+            result = db.session.execute(
+                db.update(ProcessingJob)
+                .where(ProcessingJob.id == candidate.id,
+                       ProcessingJob.attempts == candidate.attempts,
+                       ProcessingJob.status.in_(('queued', 'running')))
+                .values(status='running', worker_id=worker_id, claimed_at=now,
+                        attempts=ProcessingJob.attempts + 1)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                job = DatabaseManager.get_job(candidate.id)
+                db.session.expunge(job)
+                return job
+            # 被其他 worker 抢先领取，换下一个
+
+    @staticmethod
+    def _update_claimed_job(job, **values):
+        """Update `job` only if the claim it came from is still held; returns whether it was"""
+        result = db.session.execute(
+            db.update(ProcessingJob)
+            .where(ProcessingJob.id == job.id,
+                   ProcessingJob.status == 'running',
+                   ProcessingJob.worker_id == job.worker_id,
+                   ProcessingJob.attempts == job.attempts)
+            .values(**values)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def renew_job_lease(job):
+        """Push back the lease expiry of a claimed job; False if the claim was lost"""
+        return DatabaseManager._update_claimed_job(job, claimed_at=datetime.utcnow())
+
+    @staticmethod
+    def complete_job(job, material_id):
+        """Mark a claimed job as done; False if the claim was lost and the job left as it is"""
+        return DatabaseManager._update_claimed_job(
+            job, status='done', material_id=material_id, error=None, finished_at=datetime.utcnow())
+
+    @staticmethod
+    def fail_job(job, error, retry_backoff=5):
+        """Record a failed attempt; the job is retried with exponential backoff until max_attempts.
+
+        Returns False if the claim was lost, in which case nothing is recorded.
+        """
+        db.session.rollback()
+        now = datetime.utcnow()
+        if job.attempts < job.max_attempts:
+            values = {'status': 'queued',
+                      'available_at': now + timedelta(seconds=retry_backoff * 2 ** (job.attempts - 1))}
+        else:
+            values = {'status': 'failed', 'finished_at': now}
+        return DatabaseManager._update_claimed_job(job, error=error, **values)
+
+    @staticmethod
+    def get_job_queue_stats():
+        """Queue depth: job counts by status and the age of the oldest queued job"""
+        counts = dict(db.session.query(
+            ProcessingJob.status,
+            db.func.count(ProcessingJob.id)
+        ).group_by(ProcessingJob.status).all())
+        oldest = db.session.query(db.func.min(ProcessingJob.created_at)).filter(
+            ProcessingJob.status == 'queued').scalar()
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_queued_seconds': (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+        }
 
     @staticmethod
     def get_interaction_stats():
         """Get statistics about user interactions"""
         stats = {
-            'total_materials': StudyMaterial.query.count(),
-            'total_interactions': UserInteraction.query.count(),
+            'total_materials': 0,
+            'total_interactions': 0,
             'interactions_by_type': {},
-            'materials_by_subject': {}
+            'materials_by_subject': {},
+            'result_cache': {'hits': 0, 'misses': 0}
         }
 
+        # 读取增量维护的计数表，而不是扫描原始表
+        counters = db.session.query(StatCounter.scope, StatCounter.key, StatCounter.count).all()
+        for scope, key, count in counters:
+            if scope == 'total':
+                stats[f'total_{key}'] = count
+            elif scope == 'interaction_type':
+                stats['interactions_by_type'][key] = count
+            elif scope == 'subject':
+                stats['materials_by_subject'][key] = count
+            elif scope == 'result_cache':
+                stats['result_cache'][key] = count
+
+        return stats
+
+    @staticmethod
+    def rebuild_stat_counters():
+        """Recompute stat_counters from study_materials and user_interactions"""
+        deltas = Counter()
+        deltas[('total', 'materials')] = StudyMaterial.query.count()
+        deltas[('total', 'interactions')] = UserInteraction.query.count()
+
         # Count interactions by type
         interaction_types = db.session.query(
             UserInteraction.interaction_type,
@@ -235,7 +1243,7 @@ class DatabaseManager:
         ).group_by(UserInteraction.interaction_type).all()
 
         for type_name, count in interaction_types:
-            stats['interactions_by_type'][type_name] = count
+            deltas[('interaction_type', type_name)] = count
 
         # Count materials by subject
         subject_counts = db.session.query(
@@ -244,6 +1252,9 @@ class DatabaseManager:
         ).group_by(StudyMaterial.subject).all()
 
         for subject, count in subject_counts:
-            stats['materials_by_subject'][subject] = count
+            deltas[('subject', subject)] = count
 
-        return stats
\ No newline at end of file
+        # 结果缓存的命中计数无法从原始表重算，保留
+        db.session.execute(db.delete(StatCounter).where(StatCounter.scope != 'result_cache'))
+        _bump_counters(db.session.connection(), deltas)
+        db.session.commit()
@@ -0,0 +1,44 @@
+import json
+
+import click
+
+from database import DatabaseManager
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORTS = {
+    'materials': DatabaseManager.iter_materials,
+    'interactions': DatabaseManager.iter_interactions,
+}
+
+
+def ndjson_chunks(objects, batch_size=EXPORT_BATCH_SIZE):
+    """Serialize objects via to_dict() as NDJSON, one string per batch of lines"""
+    lines = []
+    for obj in objects:
+        lines.append(json.dumps(obj.to_dict(), ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_ndjson(table, subject=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """NDJSON chunks for every row of `table` matching the filters"""
+    rows = EXPORTS[table](subject=subject, since=since, until=until, batch_size=batch_size)
+    return ndjson_chunks(rows, batch_size)
+
+
+def register_export_commands(app):
+    @app.cli.command('export')
+    @click.argument('table', type=click.Choice(sorted(EXPORTS)))
+    @click.option('--subject', help='Only rows for this subject.')
+    @click.option('--since', type=click.DateTime(), help='Only rows created at or after this time.')
+    @click.option('--until', type=click.DateTime(), help='Only rows created before this time.')
+    @click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+                  help='Output file (default: stdout).')
+    def export_command(table, subject, since, until, output):
+        """Stream materials or interactions as NDJSON."""
+        for chunk in export_ndjson(table, subject, since, until):
+            output.write(chunk)
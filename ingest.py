@@ -0,0 +1,87 @@
+import codecs
+import hashlib
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from classifier import subject_classifier
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ContentHasher:
+    """Incremental version of database.content_hash()"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._carry = ""
+        self._started = False
+
+    def update(self, text):
+        text = self._carry + text.lower()
+        words = text.split()
+        # 末尾的词可能被切断，留到下一块
+        if words and not text[-1].isspace():
+            self._carry = words.pop()
+        else:
+            self._carry = ""
+        self._emit(words)
+
+    def hexdigest(self):
+        self._emit([self._carry] if self._carry else [])
+        self._carry = ""
+        return self._hash.hexdigest()
+
+    def _emit(self, words):
+        if not words:
+            return
+        joined = ' '.join(words)
+        self._hash.update(((' ' if self._started else '') + joined).encode('utf-8'))
+        self._started = True
+
+
+class IngestedDocument:
+    """A document read in chunks, classified and hashed on the way in"""
+
+    def __init__(self, text, subject, content_hash):
+        self.text = text
+        self.subject = subject
+        self.content_hash = content_hash
+
+
+def ingest_stream(stream, max_bytes, content_length=None, chunk_size=READ_CHUNK_SIZE, encoding='utf-8'):
+    """Read a document from `stream`, classifying and hashing each chunk as it arrives.
+
+    Raises RequestEntityTooLarge before reading anything when `content_length`
+    is already over `max_bytes`, and as soon as the stream passes it otherwise.
+    Raises LookupError if `encoding` is not a known text encoding.
+    """
+    if content_length is not None and content_length > max_bytes:
+        raise RequestEntityTooLarge()
+
+    # bytes.decode 对未知编码和 hex 之类的非文本编码都抛出 LookupError（空字节串不做检查）
+    b'\n'.decode(encoding, 'replace')
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    scan = subject_classifier.scan()
+    hasher = ContentHasher()
+    pieces = []
+    received = 0
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > max_bytes:
+            raise RequestEntityTooLarge()
+        text = decoder.decode(chunk)
+        scan.feed(text)
+        hasher.update(text)
+        pieces.append(text)
+
+    text = decoder.decode(b'', final=True)
+    if text:
+        scan.feed(text)
+        hasher.update(text)
+        pieces.append(text)
+
+    return IngestedDocument(''.join(pieces), scan.subject(), hasher.hexdigest())
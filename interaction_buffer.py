@@ -0,0 +1,128 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+class InteractionBuffer:
+    """Write-behind buffer for UserInteraction rows.
+
+    Requests only enqueue a row; a background thread writes them in bulk once
+    `batch_size` rows are waiting or `flush_interval` seconds have passed.
+    The queue is bounded: when it is full new rows are dropped and counted
+    rather than blocking the request.
+    """
+
+    def __init__(self, app, write_rows, max_size=10000, batch_size=500, flush_interval=1.0):
+        self.app = app
+        self.write_rows = write_rows
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_size)
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._start_lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        # 第一次写入时才启动后台线程。gunicorn --preload 在 fork 之前创建应用，
+        # 线程不会被复制到子进程，所以每个进程各自启动
+        if self._pid == os.getpid() or self._closed:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() or self._closed:
+                return
+            if self._pid is not None:
+                # 父进程队列里的行由父进程负责写入
+                self.queue = queue.Queue(maxsize=self.max_size)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='interaction-buffer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def put(self, row):
+        """Enqueue an interaction row; returns False if it had to be dropped"""
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            return False
+
+    def stats(self):
+        with self._counter_lock:
+            return {
+                'queued': self.queue.qsize(),
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed
+            }
+
+    def flush(self):
+        """Write everything currently queued"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 0.1)))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._flush_lock:
+            try:
+                with self.app.app_context():
+                    self.write_rows(batch)
+            except Exception:
+                self.app.logger.exception('Failed to write %d buffered interactions', len(batch))
+                with self._counter_lock:
+                    self.failed += len(batch)
+                return
+        with self._counter_lock:
+            self.written += len(batch)
@@ -0,0 +1,192 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [每个桶的计数（不累计）..., 总和, 总数]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            bucket_labels = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{bucket_labels} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {series[-1]}')
+        return lines
+
+
+class RequestMetrics:
+    """Per-route latency, SQL and phase timings for one app, rendered in Prometheus text format.
+
+    Values live in this process only; with several gunicorn workers each
+    scrape sees the worker that answered it.
+    """
+
+    def __init__(self, app, slow_request_seconds=None):
+        self.slow_request_seconds = slow_request_seconds
+        self.request_seconds = Histogram(
+            'cognigrasp_http_request_duration_seconds', 'Request latency by route.', ('method', 'route'))
+        self.requests = Counter(
+            'cognigrasp_http_requests_total', 'Requests by route and status.', ('method', 'route', 'status'))
+        self.request_queries = Histogram(
+            'cognigrasp_http_request_sql_queries', 'SQL statements executed per request.', ('route',),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.request_sql_seconds = Histogram(
+            'cognigrasp_http_request_sql_seconds', 'Time spent in SQL per request.', ('route',))
+        self.sql_queries = Counter('cognigrasp_sql_queries_total', 'SQL statements executed, including background work.')
+        self.sql_seconds = Counter('cognigrasp_sql_seconds_total', 'Time spent in SQL, including background work.')
+        self.phase_seconds = Histogram(
+            'cognigrasp_phase_duration_seconds', 'Time spent in named processing phases.', ('phase',))
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(db.engine, 'handle_error', self._handle_error)
+
+    def render(self):
+        lines = []
+        for metric in (self.request_seconds, self.requests, self.request_queries, self.request_sql_seconds,
+                       self.sql_queries, self.sql_seconds, self.phase_seconds):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def observe_phase(self, name, seconds):
+        self.phase_seconds.observe(seconds, (name,))
+        if has_request_context() and 'metrics_phases' in g:
+            g.metrics_phases[name] = g.metrics_phases.get(name, 0.0) + seconds
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_seconds = 0.0
+        g.metrics_phases = {}
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # 用路由规则而不是实际路径做标签，避免 id 造成标签数量无限增长
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        self.request_seconds.observe(elapsed, (request.method, route))
+        self.requests.inc((request.method, route, str(response.status_code)))
+        self.request_queries.observe(g.metrics_queries, (route,))
+        self.request_sql_seconds.observe(g.metrics_sql_seconds, (route,))
+
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            phases = ', '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in g.metrics_phases.items())
+            current_app.logger.warning(
+                'Slow request: %s %s -> %s in %.1fms (%d SQL statements, %.1fms in SQL%s)',
+                request.method, request.path, response.status_code, elapsed * 1000,
+                g.metrics_queries, g.metrics_sql_seconds * 1000, f'; {phases}' if phases else '')
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        # 执行失败时不会触发 after_cursor_execute，丢弃对应的开始时间
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_query_start'):
+            connection.info['metrics_query_start'].pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        self.sql_queries.inc()
+        self.sql_seconds.inc(amount=elapsed)
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries += 1
+            g.metrics_sql_seconds += elapsed
+
+
+def init_metrics(app):
+    """Enable request metrics for `app` when METRICS_ENABLED is set"""
+    if app.config.get('METRICS_ENABLED', True):
+        app.extensions['metrics'] = RequestMetrics(app, app.config.get('SLOW_REQUEST_SECONDS'))
+
+
+def get_metrics():
+    """The current app's RequestMetrics, or None when metrics are disabled"""
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as processing phase `name`"""
+    metrics = get_metrics()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_phase(name, time.perf_counter() - started)
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 import json
 
@@ -12,8 +13,9 @@ class SubjectConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subject_name = db.Column(db.String(50), unique=True, nullable=False)
     summary_template = db.Column(db.Text, nullable=False)
-    flashcards = db.Column(db.Text, nullable=False)  # JSON string
-    variations = db.Column(db.Text, nullable=False)  # JSON string
+    flashcards = db.Column(db.JSON, nullable=False)
+    variations = db.Column(db.JSON, nullable=False)
+    version = db.Column(db.Integer)  # latest SubjectConfigVersion.version, bumped on every content change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -25,36 +27,129 @@ class SubjectConfig(db.Model):
             'id': self.id,
             'subject_name': self.subject_name,
             'summary_template': self.summary_template,
-            'flashcards': json.loads(self.flashcards),
-            'variations': json.loads(self.variations),
+            'flashcards': self.flashcards,
+            'variations': self.variations,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 
+class SubjectConfigVersion(db.Model):
+    """学科配置内容的不可变快照，按模板存储的资料引用它来渲染摘要和闪卡"""
+    __tablename__ = 'subject_config_versions'
+    __table_args__ = (
+        db.UniqueConstraint('subject_config_id', 'version', name='uq_subject_config_versions_version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject_config_id = db.Column(db.Integer, db.ForeignKey('subject_configs.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    summary_template = db.Column(db.Text, nullable=False)
+    flashcards = db.Column(db.JSON, nullable=False)
+    variations = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    subject_config = db.relationship(SubjectConfig)
+
+    def __repr__(self):
+        return f'<SubjectConfigVersion {self.subject_config_id} v{self.version}>'
+
+    @staticmethod
+    def render_summary(summary_template, variations, variation_index):
+        """The summary generate_ai_response() produces for this template and variation"""
+        return f"{summary_template}\n\n{variations[variation_index]}"
+
+
 class StudyMaterial(db.Model):
     __tablename__ = 'study_materials'
+    __table_args__ = (
+        # get_recent_materials / get_materials_by_subject 按创建时间倒序读取
+        db.Index('ix_study_materials_created_at', 'created_at'),
+        db.Index('ix_study_materials_subject_created_at', 'subject', 'created_at'),
+        db.Index('ix_study_materials_content_hash', 'content_hash'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     input_text = db.Column(db.Text, nullable=False)
     subject = db.Column(db.String(50), nullable=False)
-    summary = db.Column(db.Text, nullable=False)
-    flashcards = db.Column(db.Text, nullable=False)  # JSON string
-    review_dates = db.Column(db.Text, nullable=False)  # JSON string
+    # 按模板存储时 summary / flashcards 为空，由 config_version 和 variation_index 渲染
+    summary = db.Column(db.Text)
+    flashcards = db.Column(db.JSON(none_as_null=True))
+    review_dates = db.Column(db.JSON, nullable=False)
+    content_hash = db.Column(db.String(64))  # sha256 of the normalized input, key of the result cache
+    config_version_id = db.Column(db.Integer, db.ForeignKey('subject_config_versions.id'))
+    variation_index = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 多对一懒加载会先查 identity map，同一会话中每个版本只查询一次
+    config_version = db.relationship(SubjectConfigVersion)
+
     def __repr__(self):
         return f'<StudyMaterial {self.id} - {self.subject}>'
 
+    def rendered_summary(self):
+        if self.config_version_id is None:
+            return self.summary
+        version = self.config_version
+        return SubjectConfigVersion.render_summary(version.summary_template, version.variations,
+                                                   self.variation_index)
+
+    def rendered_flashcards(self):
+        if self.config_version_id is None:
+            return self.flashcards
+        return self.config_version.flashcards
+
+    @staticmethod
+    def json_columns():
+        """Columns for row_to_json(); JSON columns come back as their stored text"""
+        return (
+            StudyMaterial.id,
+            StudyMaterial.input_text,
+            StudyMaterial.subject,
+            StudyMaterial.summary,
+            db.cast(StudyMaterial.flashcards, db.Text).label('flashcards'),
+            db.cast(StudyMaterial.review_dates, db.Text).label('review_dates'),
+            StudyMaterial.created_at,
+            StudyMaterial.processed_at,
+            StudyMaterial.config_version_id,
+            StudyMaterial.variation_index,
+            # 以下来自外连接的 subject_config_versions，仅按模板存储的行有值
+            SubjectConfigVersion.summary_template,
+            SubjectConfigVersion.variations,
+            db.cast(SubjectConfigVersion.flashcards, db.Text).label('template_flashcards')
+        )
+
+    @staticmethod
+    def row_to_json(row):
+        """Serialize a json_columns() row to the same object as to_dict(), without decoding the JSON columns"""
+        if row.config_version_id is None:
+            summary, flashcards = row.summary, row.flashcards
+        else:
+            summary = SubjectConfigVersion.render_summary(row.summary_template, row.variations, row.variation_index)
+            flashcards = row.template_flashcards
+        return (
+            '{"id": %d, "input_text": %s, "subject": %s, "summary": %s, "flashcards": %s, '
+            '"review_dates": %s, "created_at": "%s", "processed_at": "%s"}' % (
+                row.id,
+                json.dumps(row.input_text),
+                json.dumps(row.subject),
+                json.dumps(summary),
+                flashcards,
+                row.review_dates,
+                row.created_at.isoformat(),
+                row.processed_at.isoformat()
+            )
+        )
+
     def to_dict(self):
         return {
             'id': self.id,
             'input_text': self.input_text,
             'subject': self.subject,
-            'summary': self.summary,
-            'flashcards': json.loads(self.flashcards),
-            'review_dates': json.loads(self.review_dates),
+            'summary': self.rendered_summary(),
+            'flashcards': self.rendered_flashcards(),
+            'review_dates': self.review_dates,
             'created_at': self.created_at.isoformat(),
             'processed_at': self.processed_at.isoformat()
         }
@@ -62,12 +157,168 @@ class StudyMaterial(db.Model):
 
 class UserInteraction(db.Model):
     __tablename__ = 'user_interactions'
+    __table_args__ = (
+        db.Index('ix_user_interactions_material_id', 'material_id'),
+        db.Index('ix_user_interactions_interaction_type', 'interaction_type'),
+        # flask reschedule-reviews 按 id 顺序读取 scheduled_at 为空的复习
+        db.Index('ix_user_interactions_type_scheduled_at', 'interaction_type', 'scheduled_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     material_id = db.Column(db.Integer, db.ForeignKey('study_materials.id'))
     interaction_type = db.Column(db.String(50), nullable=False)  # e.g., 'view', 'export', 'share'
     interaction_data = db.Column(db.Text)  # Additional data as JSON
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    scheduled_at = db.Column(db.DateTime)  # review applied to review_cards by the scheduler
+
+    def __repr__(self):
+        return f'<UserInteraction {self.id} - {self.interaction_type}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'material_id': self.material_id,
+            'interaction_type': self.interaction_type,
+            'interaction_data': json.loads(self.interaction_data) if self.interaction_data else None,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class StatCounter(db.Model):
+    """/api/stats 使用的聚合计数，与原始数据在同一事务中更新"""
+    __tablename__ = 'stat_counters'
+
+    # 'total', 'interaction_type', 'subject' or 'result_cache' (key 'hits' / 'misses')
+    scope = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatCounter {self.scope}:{self.key}={self.count}>'
+
+
+class ProcessingJob(db.Model):
+    """异步处理队列中的任务，由 worker 进程领取执行"""
+    __tablename__ = 'processing_jobs'
+    __table_args__ = (
+        # worker 按 (status, available_at) 查找可领取的任务
+        db.Index('ix_processing_jobs_status_available_at', 'status', 'available_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    input_text = db.Column(db.Text, nullable=False)
+    material_id = db.Column(db.Integer, db.ForeignKey('study_materials.id'))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    error = db.Column(db.Text)
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
 
     def __repr__(self):
-        return f'<UserInteraction {self.id} - {self.interaction_type}>'
\ No newline at end of file
+        return f'<ProcessingJob {self.id} - {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'material_id': self.material_id,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ReviewCard(db.Model):
+    """每张闪卡的间隔重复（SM-2）状态，由 flask reschedule-reviews 批量更新"""
+    __tablename__ = 'review_cards'
+    __table_args__ = (
+        db.Index('ix_review_cards_due_at', 'due_at', 'material_id', 'card_index'),
+    )
+
+    material_id = db.Column(db.Integer, db.ForeignKey('study_materials.id'), primary_key=True)
+    card_index = db.Column(db.Integer, primary_key=True)
+    easiness = db.Column(db.Float, nullable=False, default=2.5)
+    interval_days = db.Column(db.Float, nullable=False, default=0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)
+    due_at = db.Column(db.DateTime, nullable=False)
+    last_reviewed_at = db.Column(db.DateTime)
+    last_interaction_id = db.Column(db.Integer)  # newest review interaction applied to this card
+
+    def __repr__(self):
+        return f'<ReviewCard {self.material_id}:{self.card_index} due {self.due_at}>'
+
+    def to_dict(self):
+        return {
+            'material_id': self.material_id,
+            'card_index': self.card_index,
+            'easiness': self.easiness,
+            'interval_days': self.interval_days,
+            'repetitions': self.repetitions,
+            'due_at': self.due_at.isoformat(),
+            'last_reviewed_at': self.last_reviewed_at.isoformat() if self.last_reviewed_at else None
+        }
+
+
+class ReviewDate(db.Model):
+    """study_materials.review_dates 中的每个复习时间，按到期时间建索引以便查询"""
+    __tablename__ = 'review_dates'
+    __table_args__ = (
+        # /api/reviews/due 按 (due_at, material_id, position) 顺序做范围扫描和键集分页
+        db.Index('ix_review_dates_due_at', 'due_at', 'material_id', 'position'),
+    )
+
+    material_id = db.Column(db.Integer, db.ForeignKey('study_materials.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # index in review_dates
+    due_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ReviewDate {self.material_id}:{self.position} due {self.due_at}>'
+
+    def to_dict(self):
+        return {
+            'material_id': self.material_id,
+            'position': self.position,
+            'due_at': self.due_at.isoformat()
+        }
+
+
+# 资料全文索引（SQLite FTS5）。外部内容表只保存倒排索引，原文和渲染后的摘要
+# 由 material_search_content 视图按 rowid 读取，不会再复制一份资料文本。
+# 虚拟表不能用模型声明，create_all / drop_all 时由下面的 DDL 创建和删除。
+MATERIAL_SEARCH_DDL = (
+    # 与 SubjectConfigVersion.render_summary() 相同的渲染规则
+    """CREATE VIEW IF NOT EXISTS material_search_content AS
+       SELECT m.id AS id, m.input_text AS input_text,
+              COALESCE(m.summary, v.summary_template || char(10, 10)
+                       || json_extract(v.variations, '$[' || m.variation_index || ']')) AS summary
+       FROM study_materials m LEFT JOIN subject_config_versions v ON v.id = m.config_version_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS material_search USING fts5(
+           input_text, summary,
+           content='material_search_content', content_rowid='id',
+           tokenize='porter unicode61 remove_diacritics 2')""",
+    # 摘要是同一学科共用的模板文本，权重低于用户输入
+    "INSERT INTO material_search(material_search, rank) VALUES('rank', 'bm25(1.0, 0.5)')",
+)
+
+
+def sqlite_has_fts5(connection):
+    """Whether the SQLite library behind `connection` was compiled with FTS5"""
+    return connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar() == 1
+
+
+def _fts5_compiled(ddl, target, bind, **kw):
+    return sqlite_has_fts5(bind)
+
+
+# 没有编译 FTS5 的 SQLite 不建索引，全文搜索不可用，其它功能照常
+for _statement in MATERIAL_SEARCH_DDL:
+    event.listen(db.metadata, 'after_create',
+                 db.DDL(_statement).execute_if(dialect='sqlite', callable_=_fts5_compiled))
+for _statement in ('DROP TABLE IF EXISTS material_search', 'DROP VIEW IF EXISTS material_search_content'):
+    event.listen(db.metadata, 'before_drop', db.DDL(_statement).execute_if(dialect='sqlite'))
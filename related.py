@@ -0,0 +1,350 @@
+"""TF-IDF index over materials' input text for "related materials" lookups.
+
+Terms are hashed into a fixed space of 2**20 ids, so adding documents never
+changes the vocabulary. Postings live in immutable segments in CSR layout
+(per term: a slice of document positions and term frequencies), ordered
+within each term by normalized weight. A lookup reads at most
+``max_postings`` of each query term, so its cost depends on the query, not
+on the corpus size, and scores a whole batch of queries with a few vector
+operations.
+
+``flask build-related-index`` writes a snapshot under RELATED_INDEX_PATH.
+Each process loads the newest snapshot on first use (memory-mapped, so
+gunicorn workers share the pages) and indexes materials saved since then
+straight from the database, as small extra segments.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from models import db, StudyMaterial
+
+TERM_BITS = 20
+NUM_TERMS = 1 << TERM_BITS
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from had has have in into is it its of on or that the their this '
+    'to was were which will with'.split())
+# 追加的小段超过这个数量时合并为一段
+MAX_DELTA_SEGMENTS = 8
+
+
+def term_vector(text):
+    """(term ids ascending, sublinear term frequencies) of `text`"""
+    tokens = [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+    if not tokens:
+        return np.empty(0, np.int64), np.empty(0, np.float32)
+    hashed = np.fromiter((zlib.crc32(token.encode()) for token in tokens), np.int64, len(tokens))
+    terms, counts = np.unique(hashed & (NUM_TERMS - 1), return_counts=True)
+    return terms, (1 + np.log(counts)).astype(np.float32)
+
+
+def _concat(arrays, dtype):
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.empty(0, dtype)
+
+
+def _group_rank(groups):
+    """Position of each element within its run of equal values in the sorted array `groups`"""
+    if not len(groups):
+        return np.empty(0, np.int64)
+    starts = np.r_[True, groups[1:] != groups[:-1]]
+    positions = np.arange(len(groups))
+    return positions - np.maximum.accumulate(np.where(starts, positions, 0))
+
+
+def _postings(vectors):
+    """(position, term, tf) arrays for a list of term_vector() results"""
+    lengths = np.array([len(terms) for terms, _ in vectors], np.int64)
+    return (np.repeat(np.arange(len(vectors)), lengths),
+            _concat([terms for terms, _ in vectors], np.int64),
+            _concat([tf for _, tf in vectors], np.float32))
+
+
+class Segment:
+    """Immutable postings of a set of materials, grouped by term"""
+    ARRAYS = ('material_ids', 'norms', 'terms', 'term_ptr', 'doc', 'tf')
+
+    def __init__(self, material_ids, norms, terms, term_ptr, doc, tf):
+        self.material_ids = material_ids  # 段内文档序号 -> material id
+        self.norms = norms                # 按构建时的 idf 计算的向量长度
+        self.terms = terms                # 出现过的词（升序）
+        self.term_ptr = term_ptr          # terms[i] 的倒排表为 doc/tf[term_ptr[i]:term_ptr[i + 1]]
+        self.doc = doc
+        self.tf = tf
+
+    @classmethod
+    def build(cls, material_ids, doc, term, tf, idf):
+        """Segment from (doc position, term, tf) postings, normalized with `idf`"""
+        weight = tf * idf[term]
+        norms = np.sqrt(np.bincount(doc, weight * weight, minlength=len(material_ids))).astype(np.float32)
+        norms[norms == 0] = 1
+        # 每个词的倒排表按归一化权重从大到小排列，查询时可以只读前面一段
+        order = np.lexsort((-(tf / norms[doc]), term))
+        term = term[order]
+        starts = np.flatnonzero(np.r_[True, term[1:] != term[:-1]]) if len(term) else np.empty(0, np.int64)
+        return cls(np.asarray(material_ids, np.int64), norms, term[starts].astype(np.int32),
+                   np.r_[starts, len(term)].astype(np.int64), doc[order].astype(np.int32), tf[order])
+
+    @classmethod
+    def from_vectors(cls, material_ids, vectors, idf):
+        """Segment for materials with the given term_vector() results"""
+        doc, term, tf = _postings(vectors)
+        return cls.build(material_ids, doc, term, tf, idf)
+
+    @classmethod
+    def merge(cls, segments, idf):
+        """One segment holding the postings of `segments`, renormalized with `idf`"""
+        material_ids, docs, terms, tfs = [], [], [], []
+        offset = 0
+        for segment in segments:
+            material_ids.append(segment.material_ids)
+            docs.append(segment.doc.astype(np.int64) + offset)
+            terms.append(np.repeat(segment.terms.astype(np.int64), np.diff(segment.term_ptr)))
+            tfs.append(segment.tf)
+            offset += len(segment.material_ids)
+        return cls.build(_concat(material_ids, np.int64), _concat(docs, np.int64),
+                         _concat(terms, np.int64), _concat(tfs, np.float32), idf)
+
+    def score(self, query, terms, weights, max_postings=None):
+        """(query, material_id, dot / norm) for every document sharing a term with a query"""
+        index = np.searchsorted(self.terms, terms)
+        found = index < len(self.terms)
+        found[found] = self.terms[index[found]] == terms[found]
+        query, weights, index = query[found], weights[found], index[found]
+
+        start = self.term_ptr[index]
+        length = self.term_ptr[index + 1] - start
+        if max_postings:
+            length = np.minimum(length, max_postings)
+        total = int(length.sum())
+        if not total:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+
+        # 把每个查询词对应的倒排表片段拼成一个数组
+        pair = np.repeat(np.arange(len(index)), length)
+        position = start[pair] + np.arange(total) - np.repeat(np.cumsum(length) - length, length)
+        doc = self.doc[position]
+        count = len(self.material_ids)
+        keys, inverse = np.unique(query[pair] * count + doc, return_inverse=True)
+        dots = np.bincount(inverse, self.tf[position] * weights[pair])
+        doc = keys % count
+        return keys // count, self.material_ids[doc], dots / self.norms[doc]
+
+
+class RelatedIndex:
+    """Segments plus the document frequencies their idf weights come from"""
+
+    def __init__(self, segments=(), df=None, doc_count=0, last_id=0):
+        self.segments = list(segments)
+        self.df = np.zeros(NUM_TERMS, np.int32) if df is None else np.array(df, np.int32)
+        self.doc_count = doc_count
+        self.last_id = last_id  # 已索引的最大 material id
+        self._idf = self._compute_idf()
+
+    def _compute_idf(self):
+        return (np.log((1.0 + self.doc_count) / (1.0 + self.df)) + 1).astype(np.float32)
+
+    def add(self, rows):
+        """Index (material_id, input_text) rows, which must come after every material already indexed"""
+        if not rows:
+            return
+        vectors = [term_vector(text) for _, text in rows]
+        # 每篇文档的词已去重，按词累加即为文档频率
+        np.add.at(self.df, _postings(vectors)[1], 1)
+        self.doc_count += len(rows)
+        self.last_id = max(self.last_id, max(material_id for material_id, _ in rows))
+        self._idf = self._compute_idf()
+
+        segments = self.segments + [
+            Segment.from_vectors([material_id for material_id, _ in rows], vectors, self._idf)]
+        if len(segments) > MAX_DELTA_SEGMENTS + 1:
+            # 保留最大的一段（快照），其余的小段合并
+            segments = [segments[0], Segment.merge(segments[1:], self._idf)]
+        # 整体替换列表，并发的查询看到的总是完整的旧列表或新列表
+        self.segments = segments
+
+    def top_k(self, queries, k=5, max_postings=None, max_query_terms=None):
+        """Most similar materials for each (material_id, text) query, excluding the material itself.
+
+        Only the `max_query_terms` highest-weighted terms of each query and
+        the first `max_postings` postings of each term are scored; None
+        scores everything. Returns one list of (material_id, cosine
+        similarity) per query, best first.
+        """
+        if not queries:
+            return []
+        query, terms, tf = _postings([term_vector(text) for _, text in queries])
+        idf = self._idf
+        weight = tf * idf[terms]
+        # 向量长度按完整的查询计算，裁剪查询词后分数仍与精确的余弦相似度可比
+        query_norms = np.sqrt(np.bincount(query, weight * weight, minlength=len(queries)))
+        query_norms[query_norms == 0] = 1
+        if max_query_terms:
+            order = np.lexsort((-weight, query))
+            keep = order[_group_rank(query[order]) < max_query_terms]
+            query, terms, weight = query[keep], terms[keep], weight[keep]
+        # 文档一侧只存 tf，两侧的 idf 都乘在查询权重上
+        weights = weight * idf[terms]
+
+        parts = [segment.score(query, terms, weights, max_postings) for segment in self.segments]
+        owner = _concat([part[0] for part in parts], np.int64)
+        material_ids = _concat([part[1] for part in parts], np.int64)
+        scores = _concat([part[2] for part in parts], np.float64) / query_norms[owner]
+        exclude = np.array([material_id for material_id, _ in queries], np.int64)
+        keep = material_ids != exclude[owner]
+        owner, material_ids, scores = owner[keep], material_ids[keep], scores[keep]
+
+        # 按查询分组、组内按分数从高到低，每组取前 k 个。
+        # 合成一个浮点键排序，比 lexsort 多个键快得多
+        spread = float(scores.max()) + 1 if len(scores) else 1.0
+        order = np.argsort(owner * spread - scores, kind='stable')
+        owner = owner[order]
+        rank = _group_rank(owner)
+        selected = order[rank < k]
+        results = [[] for _ in queries]
+        for query_index, material_id, score in zip(owner[rank < k], material_ids[selected], scores[selected]):
+            results[query_index].append((int(material_id), float(score)))
+        return results
+
+    def save(self, path):
+        """Write the index as one merged segment to a new snapshot directory under `path`; returns it"""
+        merged = Segment.merge(self.segments, self._idf)
+        os.makedirs(path, exist_ok=True)
+        version = f'{time.time_ns()}'
+        target = os.path.join(path, version)
+        staging = target + '.tmp'
+        os.makedirs(staging)
+        for name in Segment.ARRAYS:
+            np.save(os.path.join(staging, f'{name}.npy'), getattr(merged, name))
+        np.save(os.path.join(staging, 'df.npy'), self.df)
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({'doc_count': self.doc_count, 'last_id': self.last_id, 'term_bits': TERM_BITS}, f)
+        os.rename(staging, target)
+
+        # CURRENT 用改名原子替换，读取方不会看到写了一半的快照
+        with open(os.path.join(path, 'CURRENT.tmp'), 'w') as f:
+            f.write(version)
+        os.replace(os.path.join(path, 'CURRENT.tmp'), os.path.join(path, 'CURRENT'))
+        for name in os.listdir(path):
+            # 其他进程已映射的旧文件在删除后仍可读取
+            if name not in (version, 'CURRENT') and os.path.isdir(os.path.join(path, name)):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        return target
+
+    @staticmethod
+    def current_version(path):
+        """Name of the newest snapshot under `path`, or None"""
+        try:
+            with open(os.path.join(path, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path, version):
+        """The snapshot `version` under `path`, with its arrays memory-mapped"""
+        directory = os.path.join(path, version)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['term_bits'] != TERM_BITS:
+            raise ValueError(f'Snapshot {directory} uses {meta["term_bits"]}-bit term ids')
+        segment = Segment(*(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                            for name in Segment.ARRAYS))
+        return cls([segment], np.load(os.path.join(directory, 'df.npy')), meta['doc_count'], meta['last_id'])
+
+
+def _new_materials(last_id, batch_size):
+    # 按 id 追赶；SQLite 的写入是串行的，id 按提交顺序递增
+    return db.session.query(StudyMaterial.id, StudyMaterial.input_text).filter(
+        StudyMaterial.id > last_id).order_by(StudyMaterial.id).limit(batch_size).all()
+
+
+def catch_up(index, batch_size=10000):
+    """Add materials saved after index.last_id; returns how many were added"""
+    added = 0
+    while True:
+        rows = _new_materials(index.last_id, batch_size)
+        index.add([(row.id, row.input_text) for row in rows])
+        added += len(rows)
+        if len(rows) < batch_size:
+            return added
+
+
+def build_related_index(path, batch_size=10000):
+    """Index every material from scratch and write a snapshot to `path`; returns the material count"""
+    # 先收集全部倒排项和文档频率，再按最终的 idf 一次性建段
+    index = RelatedIndex()
+    material_ids, docs, terms, tfs = [], [], [], []
+    while True:
+        rows = _new_materials(index.last_id, batch_size)
+        if not rows:
+            break
+        doc, term, tf = _postings([term_vector(row.input_text) for row in rows])
+        np.add.at(index.df, term, 1)
+        material_ids.append(np.array([row.id for row in rows], np.int64))
+        docs.append(doc + index.doc_count)
+        terms.append(term)
+        tfs.append(tf)
+        index.doc_count += len(rows)
+        index.last_id = rows[-1].id
+    index._idf = index._compute_idf()
+    index.segments = [Segment.build(_concat(material_ids, np.int64), _concat(docs, np.int64),
+                                    _concat(terms, np.int64), _concat(tfs, np.float32), index._idf)]
+    index.save(path)
+    return index.doc_count
+
+
+class _IndexHolder:
+    """Per-app index, reloaded when a newer snapshot appears and caught up from the database"""
+
+    def __init__(self, path, refresh_interval):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.index is not None and time.monotonic() - self.checked_at < self.refresh_interval:
+            return self.index
+        with self.lock:
+            version = RelatedIndex.current_version(self.path)
+            index = self.index
+            if index is None or version != self.version:
+                index = RelatedIndex.load(self.path, version) if version else RelatedIndex()
+            catch_up(index)
+            self.index, self.version = index, version
+            self.checked_at = time.monotonic()
+            return index
+
+
+_holders_lock = threading.Lock()
+
+
+def _holder(app):
+    with _holders_lock:
+        holder = app.extensions.get('related_index')
+        if holder is None:
+            path = app.config.get('RELATED_INDEX_PATH') or os.path.join(app.instance_path, 'related_index')
+            holder = app.extensions['related_index'] = _IndexHolder(
+                path, app.config.get('RELATED_INDEX_REFRESH_INTERVAL', 1.0))
+        return holder
+
+
+def find_related(app, queries, k=5):
+    """Top-k related materials for each (material_id, input_text) query; see RelatedIndex.top_k"""
+    index = _holder(app).get()
+    return index.top_k(queries, k, app.config.get('RELATED_MAX_POSTINGS', 2000),
+                       app.config.get('RELATED_MAX_QUERY_TERMS', 32))
+
+
+def index_path(app):
+    """Directory holding the app's related-index snapshots"""
+    return _holder(app).path
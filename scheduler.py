@@ -0,0 +1,194 @@
+"""SM-2 spaced-repetition scheduling driven by logged review interactions.
+
+Review outcomes arrive through /api/interaction as
+``{"interaction_type": "review", "material_id": ..., "card_index": ..., "quality": 0-5}``.
+``flask reschedule-reviews`` applies every review not applied yet and marks
+it with ``scheduled_at`` in the same transaction that updates its card.
+Progress is tracked per review rather than as a highest-applied id: on
+PostgreSQL a transaction can commit a review with a lower id after one with
+a higher id was already applied, and a watermark would skip it for good.
+Such a late review is applied on the next pass, after the newer ones.
+
+Card state is held in NumPy arrays and updated one "round" at a time, each
+round covering the next review of every card that has one, so the cost is a
+handful of vector operations rather than a Python loop per card.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+
+from database import upsert_rows
+from models import db, ReviewCard, UserInteraction
+
+REVIEW_INTERACTION = 'review'
+DEFAULT_EASINESS = 2.5
+MIN_EASINESS = 1.3
+# material_id 和 card_index 合成一个 int64 键
+CARD_INDEX_BITS = 20
+SECONDS_PER_DAY = 86400
+
+
+def sm2_update(easiness, interval, repetitions, quality):
+    """One SM-2 step for arrays of cards; returns new (easiness, interval_days, repetitions)"""
+    passed = quality >= 3
+    miss = 5.0 - quality
+    new_interval = np.where(repetitions == 0, 1.0,
+                            np.where(repetitions == 1, 6.0, np.round(interval * easiness)))
+    new_interval = np.where(passed, new_interval, 1.0)
+    new_repetitions = np.where(passed, repetitions + 1, 0)
+    # 回答失败时从头开始重复，但不改变难度系数
+    new_easiness = np.where(passed,
+                            np.maximum(MIN_EASINESS, easiness + (0.1 - miss * (0.08 + miss * 0.02))),
+                            easiness)
+    return new_easiness, new_interval, new_repetitions
+
+
+def apply_reviews(state, card_pos, quality, reviewed_at):
+    """Apply reviews to the card state arrays in place.
+
+    `state` holds equal-length arrays 'easiness', 'interval', 'repetitions',
+    'due_at' and 'last_reviewed_at' (datetime64[s]). Review i hit card
+    card_pos[i] with `quality` at `reviewed_at`; reviews must be in time order.
+    """
+    count = len(card_pos)
+    if not count:
+        return
+
+    # 按卡片分组并保持时间顺序，求出每条复习在该卡片中的序号
+    order = np.lexsort((np.arange(count), card_pos))
+    sorted_pos = card_pos[order]
+    starts = np.r_[True, sorted_pos[1:] != sorted_pos[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(count), 0))
+    rank = np.arange(count) - group_start
+
+    for round_number in range(rank.max() + 1):
+        selected = order[rank == round_number]
+        pos = card_pos[selected]
+        easiness, interval, repetitions = sm2_update(
+            state['easiness'][pos], state['interval'][pos], state['repetitions'][pos], quality[selected])
+        state['easiness'][pos] = easiness
+        state['interval'][pos] = interval
+        state['repetitions'][pos] = repetitions
+        state['last_reviewed_at'][pos] = reviewed_at[selected]
+        state['due_at'][pos] = reviewed_at[selected] + (interval * SECONDS_PER_DAY).astype('timedelta64[s]')
+
+
+def _parse_reviews(rows):
+    """(interaction ids, keys, qualities, times) for the well-formed review rows"""
+    ids, keys, qualities, times = [], [], [], []
+    for row in rows:
+        try:
+            data = json.loads(row.interaction_data)
+            material_id = int(row.material_id)
+            card_index = int(data['card_index'])
+            quality = int(data['quality'])
+        except (TypeError, ValueError, KeyError):
+            continue
+        if not 0 <= quality <= 5 or not 0 <= card_index < 1 << CARD_INDEX_BITS:
+            continue
+        ids.append(row.id)
+        keys.append(material_id << CARD_INDEX_BITS | card_index)
+        qualities.append(quality)
+        times.append(row.created_at)
+    return (np.array(ids, dtype=np.int64), np.array(keys, dtype=np.int64),
+            np.array(qualities, dtype=np.float64), np.array(times, dtype='datetime64[s]'))
+
+
+def _load_state(keys):
+    """Current state of the cards with the given (sorted, unique) keys, defaults for new cards"""
+    count = len(keys)
+    state = {
+        'easiness': np.full(count, DEFAULT_EASINESS),
+        'interval': np.zeros(count),
+        'repetitions': np.zeros(count, dtype=np.int64),
+        'due_at': np.zeros(count, dtype='datetime64[s]'),
+        'last_reviewed_at': np.zeros(count, dtype='datetime64[s]'),
+    }
+    material_ids = np.unique(keys >> CARD_INDEX_BITS).tolist()
+    for start in range(0, len(material_ids), 500):
+        rows = db.session.query(
+            ReviewCard.material_id, ReviewCard.card_index, ReviewCard.easiness,
+            ReviewCard.interval_days, ReviewCard.repetitions
+        ).filter(ReviewCard.material_id.in_(material_ids[start:start + 500])).all()
+        if not rows:
+            continue
+        columns = list(zip(*rows))
+        existing = np.array(columns[0], dtype=np.int64) << CARD_INDEX_BITS | np.array(columns[1], dtype=np.int64)
+        pos = np.searchsorted(keys, existing)
+        found = (pos < count) & (keys[np.minimum(pos, count - 1)] == existing)
+        state['easiness'][pos[found]] = np.array(columns[2])[found]
+        state['interval'][pos[found]] = np.array(columns[3])[found]
+        state['repetitions'][pos[found]] = np.array(columns[4])[found]
+    return state
+
+
+def _mark_scheduled(ids):
+    """Set scheduled_at on the given reviews; False if another pass already claimed any of them"""
+    now = datetime.utcnow()
+    marked = 0
+    for start in range(0, len(ids), 500):
+        marked += db.session.execute(
+            db.update(UserInteraction)
+            .where(UserInteraction.id.in_(ids[start:start + 500]), UserInteraction.scheduled_at.is_(None))
+            .values(scheduled_at=now)
+        ).rowcount
+    return marked == len(ids)
+
+
+def _apply_batch(rows):
+    """Apply a batch of review rows and mark all of them, malformed ones included; returns how many applied.
+
+    Returns None, with nothing written, if a concurrent pass got to some of the rows first.
+    """
+    if not _mark_scheduled([row.id for row in rows]):
+        db.session.rollback()
+        return None
+
+    ids, keys, qualities, times = _parse_reviews(rows)
+    if not len(ids):
+        db.session.commit()
+        return 0
+
+    unique_keys, card_pos = np.unique(keys, return_inverse=True)
+    state = _load_state(unique_keys)
+    apply_reviews(state, card_pos, qualities, times)
+
+    last_ids = np.zeros(len(unique_keys), dtype=np.int64)
+    np.maximum.at(last_ids, card_pos, ids)
+
+    upsert_rows(db.session.connection(), ReviewCard.__table__, [
+        {
+            'material_id': key >> CARD_INDEX_BITS,
+            'card_index': key & ((1 << CARD_INDEX_BITS) - 1),
+            'easiness': easiness,
+            'interval_days': interval,
+            'repetitions': repetitions,
+            'due_at': due_at,
+            'last_reviewed_at': reviewed_at,
+            'last_interaction_id': last_id
+        }
+        for key, easiness, interval, repetitions, due_at, reviewed_at, last_id in zip(
+            unique_keys.tolist(), state['easiness'].tolist(), state['interval'].tolist(),
+            state['repetitions'].tolist(), state['due_at'].astype('datetime64[us]').tolist(),
+            state['last_reviewed_at'].astype('datetime64[us]').tolist(), last_ids.tolist())
+    ], ('material_id', 'card_index'))
+    db.session.commit()
+    return len(ids)
+
+
+def reschedule_reviews(batch_size=100000):
+    """Apply review interactions not applied by an earlier pass; returns how many were applied"""
+    applied = 0
+    while True:
+        rows = db.session.query(
+            UserInteraction.id, UserInteraction.material_id,
+            UserInteraction.interaction_data, UserInteraction.created_at
+        ).filter(
+            UserInteraction.interaction_type == REVIEW_INTERACTION,
+            UserInteraction.scheduled_at.is_(None)
+        ).order_by(UserInteraction.id).limit(batch_size).all()
+        if not rows:
+            return applied
+        # 与另一个并发的调度进程冲突时，重新读取剩下的复习
+        applied += _apply_batch(rows) or 0
@@ -0,0 +1,114 @@
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from classifier import subject_classifier
+
+# 空行或 Markdown 标题处切分段落
+SECTION_BREAK = re.compile(r'\n\s*\n|\n(?=#{1,6}\s)')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def split_sections(text, target_chars=20000):
+    """Split text into sections at paragraph breaks, merging paragraphs up to target_chars"""
+    sections = []
+    current = []
+    length = 0
+    for paragraph in SECTION_BREAK.split(text):
+        if not paragraph.strip():
+            continue
+        if current and length + len(paragraph) > target_chars:
+            sections.append('\n\n'.join(current))
+            current = []
+            length = 0
+        current.append(paragraph)
+        length += len(paragraph)
+    if current:
+        sections.append('\n\n'.join(current))
+    return sections
+
+
+def score_section(text):
+    """Runs in a pool worker: subject scores for one section"""
+    return subject_classifier.score(text)
+
+
+def get_pool(max_workers=None):
+    """The process pool shared by all requests in this worker process"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # gunicorn fork 之后不能复用父进程的进程池
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn 启动干净的子进程，不复制 web 进程里的线程、锁和数据库连接
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_pool(pool=None, wait=True):
+    """Shut down the shared pool (or only `pool`, if it is still the shared one), cancelling queued sections"""
+    global _pool
+    with _pool_lock:
+        if pool is not None and pool is not _pool:
+            return
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+def pick_subject(scores):
+    """Highest-priority subject with any keyword hit, as SubjectClassifier.classify does"""
+    for subject in subject_classifier.subjects:
+        if scores.get(subject):
+            return subject
+    return subject_classifier.default_subject
+
+
+def analyze_sections(text, target_chars=20000, timeout=10.0, max_workers=None, min_pool_chars=0):
+    """Score each section of `text`, on the shared process pool for documents of at least `min_pool_chars`.
+
+    Returns (overall_subject, sections) where each section is a dict with its
+    index, character count, subject, scores and whether it timed out. Sections
+    not finished `timeout` seconds after the document was submitted count as
+    the default subject. Documents with a single section or shorter than
+    `min_pool_chars` are scored inline, and so is everything when the pool
+    would have fewer than two workers.
+    """
+    sections = split_sections(text, target_chars)
+    # 单个子进程只会比直接计算多出进程间通信的开销（见 benchmarks/bench_sections.py）
+    workers = max_workers if max_workers is not None else os.cpu_count() or 1
+    if len(sections) <= 1 or workers < 2 or len(text) < min_pool_chars:
+        results = [score_section(section) for section in sections]
+        timed_out = [False] * len(sections)
+    else:
+        pool = get_pool(max_workers)
+        futures = [pool.submit(score_section, section) for section in sections]
+        # 所有分段共用一个截止时间
+        _, pending = concurrent.futures.wait(futures, timeout=timeout)
+        if pending:
+            # 正在运行的分段无法单独取消：丢弃整个进程池，排队的分段随之取消，
+            # 下一个请求会创建新的进程池，不用等这些分段跑完
+            shutdown_pool(pool, wait=False)
+        # 其他请求超时丢弃进程池时，本请求排队中的分段会被取消
+        timed_out = [future in pending or future.cancelled() for future in futures]
+        results = [{} if late else future.result() for future, late in zip(futures, timed_out)]
+
+    overall = {subject: 0 for subject in subject_classifier.subjects}
+    analyzed = []
+    for index, (section, scores, late) in enumerate(zip(sections, results, timed_out)):
+        for subject, score in scores.items():
+            overall[subject] += score
+        analyzed.append({
+            'index': index,
+            'chars': len(section),
+            'subject': pick_subject(scores),
+            'scores': scores,
+            'timed_out': late
+        })
+    return pick_subject(overall), analyzed
@@ -18,7 +18,7 @@ def test_process_empty_input(client):
     assert b'Please enter some study material' in response.data
 
 
-@patch('cognigrasp_demo.generate_ai_response')
+@patch('cognigrasp_app.generate_ai_response')
 def test_process_valid_input(mock_ai_response, client):
     mock_ai_response.return_value = {
         "summary": "Test summary",
@@ -32,7 +32,7 @@ def test_process_valid_input(mock_ai_response, client):
     assert b'Test summary' in response.data
 
     # 检查数据是否保存到数据库
-    material = StudyMaterial.query.first()
+    material = StudyMaterial.query.filter_by(input_text='Test input').first()
     assert material is not None
     assert material.input_text == 'Test input'
 
@@ -78,7 +78,7 @@ def test_api_get_stats(client):
         material_id=material.id,
         interaction_type="view"
     )
-    from cognigrasp_demo import db
+    from models import db
     db.session.add(interaction)
     db.session.commit()
 
@@ -158,4 +158,1053 @@ def test_generate_ai_response():
     response = generate_ai_response("quadratic equation")
     assert response is not None
     assert response['subject'] == 'math'
-    assert 'Mathematical Concept Analysis' in response['summary']
\ No newline at end of file
+    assert 'Mathematical Concept Analysis' in response['summary']
+
+def test_subject_classifier_matches_keyword_priority():
+    from classifier import subject_classifier
+    from benchmarks.bench_classifier import legacy_detect_subject
+    samples = [
+        "quadratic equation",
+        "The ancient kingdom fell after the war",
+        "Python code for a sorting algorithm",
+        "Atoms and molecules in chemistry",
+        "An algebra problem about the war budget",
+        "Nothing to see here",
+        "",
+    ]
+    for text in samples:
+        assert subject_classifier.classify(text) == legacy_detect_subject(text)
+
+
+def test_subject_classifier_scores_across_chunk_boundaries():
+    from classifier import SubjectClassifier
+    classifier = SubjectClassifier(chunk_size=4)
+    scan = classifier.scan(exhaustive=True)
+    for piece in ["The PYTH", "ON code and the hist", "ory of al", "gebra"]:
+        scan.feed(piece)
+    scores = scan.scores()
+    assert scores['programming'] == 2
+    assert scores['history'] == 1
+    assert scores['math'] == 1
+    assert scan.subject() == 'math'
+
+
+def test_subject_config_cache_invalidated_on_update(client):
+    from database import DatabaseManager
+    assert DatabaseManager.get_subject_config('math')['summary_template'] == 'Math summary template'
+
+    response = client.put('/api/subject-configs/math', json={'summary_template': 'Updated template'})
+    assert response.status_code == 200
+    assert DatabaseManager.get_subject_config('math')['summary_template'] == 'Updated template'
+
+
+def test_subject_config_cache_notices_other_writers(client):
+    from database import DatabaseManager
+    from models import db
+    from models import SubjectConfig
+    assert DatabaseManager.get_subject_config('math')['flashcards'] == ["Math flashcard 1", "Math flashcard 2"]
+
+    # 模拟另一个 worker 直接写数据库
+    db.session.add(SubjectConfig(
+        subject_name="history",
+        summary_template="History summary template",
+        flashcards=["History flashcard"],
+        variations=["History variation"]
+    ))
+    db.session.commit()
+    assert DatabaseManager.get_subject_config('history')['summary_template'] == 'History summary template'
+
+
+def test_api_process_batch(client):
+    response = client.post('/api/process/batch', json={
+        'study_materials': ['Solve the quadratic equation', 'Notes on something else']
+    })
+    assert response.status_code == 200
+    results = json.loads(response.data)['results']
+    assert [result['subject'] for result in results] == ['math', 'general']
+
+    for result in results:
+        material = StudyMaterial.query.get(result['material_id'])
+        assert material is not None
+        assert material.subject == result['subject']
+        interaction = UserInteraction.query.filter_by(material_id=material.id).one()
+        assert interaction.interaction_type == 'process'
+
+
+def test_api_process_batch_rejects_invalid_items(client):
+    response = client.post('/api/process/batch', json={'study_materials': ['ok', '   ']})
+    assert response.status_code == 400
+    assert StudyMaterial.query.count() == 1
+
+    response = client.post('/api/process/batch', json={'study_materials': []})
+    assert response.status_code == 400
+
+    # 合法 JSON 但不是对象
+    assert client.post('/api/process/batch', json=[1, 2]).status_code == 400
+
+
+def test_interaction_buffer_bulk_writes_and_counts_drops(app):
+    from datetime import datetime
+    from database import DatabaseManager
+    from interaction_buffer import InteractionBuffer
+
+    buffer = InteractionBuffer(app, DatabaseManager.insert_interactions,
+                               max_size=2, batch_size=100, flush_interval=60)
+    buffer.close()
+
+    material = StudyMaterial.query.first()
+    row = {'material_id': material.id, 'interaction_type': 'view',
+           'interaction_data': None, 'created_at': datetime.utcnow()}
+    assert buffer.put(dict(row))
+    assert buffer.put(dict(row))
+    assert not buffer.put(dict(row))
+
+    buffer.flush()
+    assert UserInteraction.query.filter_by(interaction_type='view').count() == 2
+    assert buffer.stats() == {'queued': 0, 'written': 2, 'dropped': 1, 'failed': 0}
+
+
+def test_stat_counters_follow_writes_and_rebuild(client):
+    from database import DatabaseManager
+    from models import StatCounter
+    from models import db
+
+    client.post('/api/process/batch', json={'study_materials': ['An algebra exercise']})
+    material = StudyMaterial.query.first()
+    DatabaseManager.log_interaction(material.id, 'view')
+
+    expected = {
+        'total_materials': 2,
+        'total_interactions': 2,
+        'interactions_by_type': {'process': 1, 'view': 1},
+        'materials_by_subject': {'math': 2},
+        'result_cache': {'hits': 0, 'misses': 1}
+    }
+    assert json.loads(client.get('/api/stats').data) == expected
+
+    db.session.execute(db.delete(StatCounter).where(StatCounter.scope != 'result_cache'))
+    db.session.commit()
+    DatabaseManager.rebuild_stat_counters()
+    assert DatabaseManager.get_interaction_stats() == expected
+
+
+def _query_plans(fn):
+    """Run fn and return the SQLite query plan of every SELECT it executed"""
+    from sqlalchemy import event
+    from models import db
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    plans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            plans.append(' | '.join(row[-1] for row in rows))
+    return plans
+
+
+def test_material_listing_queries_use_indexes(app):
+    from database import DatabaseManager
+    plans = _query_plans(lambda: (DatabaseManager.get_recent_materials(10),
+                                  DatabaseManager.get_materials_by_subject('math', 10)))
+    assert len(plans) == 2
+    for plan in plans:
+        assert 'USING INDEX ix_study_materials_' in plan, plan
+        assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_upgrade_schema_creates_missing_indexes(app):
+    from database import DatabaseManager
+    from models import db
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP INDEX ix_user_interactions_material_id')
+
+    DatabaseManager.upgrade_schema()
+    DatabaseManager.upgrade_schema()
+
+    plans = _query_plans(lambda: UserInteraction.query.filter_by(material_id=1).all())
+    assert 'USING INDEX ix_user_interactions_material_id' in plans[0], plans[0]
+
+
+def test_upgrade_db_command_on_original_schema(app):
+    from models import db
+    db.session.remove()
+    db.drop_all()
+    # 最初版本只有这三张表
+    with db.engine.begin() as conn:
+        for statement in (
+                'CREATE TABLE subject_configs (id INTEGER PRIMARY KEY, subject_name VARCHAR(50) NOT NULL UNIQUE, '
+                'summary_template TEXT NOT NULL, flashcards TEXT NOT NULL, variations TEXT NOT NULL, '
+                'created_at DATETIME, updated_at DATETIME)',
+                'CREATE TABLE study_materials (id INTEGER PRIMARY KEY, input_text TEXT NOT NULL, '
+                'subject VARCHAR(50) NOT NULL, summary TEXT NOT NULL, flashcards TEXT NOT NULL, '
+                'review_dates TEXT NOT NULL, created_at DATETIME, processed_at DATETIME)',
+                'CREATE TABLE user_interactions (id INTEGER PRIMARY KEY, '
+                'material_id INTEGER REFERENCES study_materials (id), interaction_type VARCHAR(50) NOT NULL, '
+                'interaction_data TEXT, created_at DATETIME)',
+                "INSERT INTO study_materials VALUES (1, 'Old notes', 'math', 'Summary', '[]', '[]', NULL, NULL)"):
+            conn.exec_driver_sql(statement)
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+    assert result.exit_code == 0, result.output
+    assert 'Database schema is up to date.' in result.output
+    inspector = db.inspect(db.engine)
+    assert {'stat_counters', 'processing_jobs', 'review_cards'} <= set(inspector.get_table_names())
+    assert 'content_hash' in {column['name'] for column in inspector.get_columns('study_materials')}
+    assert db.session.get(StudyMaterial, 1).input_text == 'Old notes'
+
+
+def test_api_materials_keyset_pagination(client):
+    from datetime import datetime
+    from models import db
+    same_time = datetime(2024, 1, 1, 12, 0)
+    for index in range(4):
+        db.session.add(StudyMaterial(
+            input_text=f"Material {index}", subject="math" if index % 2 else "history",
+            summary="Summary", flashcards=[], review_dates=[], created_at=same_time))
+    db.session.commit()
+
+    seen = []
+    url = '/api/materials?limit=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(material['id'] for material in json.loads(response.data))
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/materials?limit=2&cursor={cursor}' if cursor else None
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+    response = client.get('/api/materials?subject=math&limit=1')
+    first = json.loads(response.data)
+    response = client.get(response.headers['Link'].split(';')[0].strip('<>'))
+    second = json.loads(response.data)
+    assert 'X-Next-Cursor' in response.headers
+    assert first[0]['id'] != second[0]['id']
+    assert {first[0]['subject'], second[0]['subject']} == {'math'}
+
+    assert client.get('/api/materials?cursor=not-a-cursor').status_code == 400
+
+
+def test_api_materials_clamps_limit(client):
+    from models import db
+    for index in range(120):
+        db.session.add(StudyMaterial(input_text=f"Material {index}", subject="math", summary="Summary",
+                                     flashcards=[], review_dates=[]))
+    db.session.commit()
+
+    for limit in (-1, 0, -50):
+        response = client.get(f'/api/materials?limit={limit}')
+        assert response.status_code == 200
+        assert len(json.loads(response.data)) == 1
+        assert 'X-Next-Cursor' in response.headers
+
+    response = client.get('/api/materials?limit=100000')
+    assert response.status_code == 200
+    assert len(json.loads(response.data)) == 100
+
+
+def test_material_cursor_queries_use_indexes(app):
+    from database import DatabaseManager
+    material = StudyMaterial.query.first()
+    cursor = DatabaseManager.encode_material_cursor(material)
+    plans = _query_plans(lambda: (DatabaseManager.get_recent_materials(10, cursor),
+                                  DatabaseManager.get_materials_by_subject('math', 10, cursor)))
+    for plan in plans:
+        assert 'USING INDEX ix_study_materials_' in plan, plan
+        assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_api_export_streams_ndjson(client):
+    from datetime import datetime
+    from models import db
+    db.session.add(StudyMaterial(
+        input_text="Old history notes", subject="history", summary="Summary",
+        flashcards=[], review_dates=[], created_at=datetime(2020, 1, 1)))
+    db.session.commit()
+    material = StudyMaterial.query.filter_by(subject='math').first()
+    client.post('/api/interaction', json={'material_id': material.id, 'interaction_type': 'view'})
+
+    response = client.get('/api/export/materials')
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['subject'] for row in rows] == ['math', 'history']
+
+    response = client.get('/api/export/materials?subject=history&until=2021-01-01')
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['input_text'] for row in rows] == ['Old history notes']
+
+    response = client.get('/api/export/interactions?subject=math')
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['interaction_type'] for row in rows] == ['view']
+    assert rows[0]['interaction_data']['material_id'] == material.id
+
+    assert client.get('/api/export/materials?since=yesterday').status_code == 400
+
+
+def test_api_materials_raw_json_matches_to_dict(client):
+    client.post('/api/process/batch', json={'study_materials': ['Ünïcode "quoted" history\nnotes']})
+    data = json.loads(client.get('/api/materials').data)
+    expected = [material.to_dict() for material in
+                StudyMaterial.query.order_by(StudyMaterial.created_at.desc(), StudyMaterial.id.desc())]
+    assert data == expected
+
+
+def test_conditional_get_for_materials(client):
+    material = StudyMaterial.query.first()
+    for url in (f'/api/materials/{material.id}', f'/material/{material.id}'):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert 'public' in response.headers['Cache-Control']
+
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        response = client.get(url, headers={'If-None-Match': '"something-else"'})
+        assert response.status_code == 200
+
+    # 304 的浏览同样记录交互
+    assert UserInteraction.query.filter_by(interaction_type='api_view').count() == 3
+
+
+def test_conditional_get_for_subject_configs(client):
+    for url in ('/api/subject-configs', '/api/subject-configs/math'):
+        etag = client.get(url).headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        client.put('/api/subject-configs/math', json={'summary_template': f'Changed via {url}'})
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+
+def test_process_reuses_result_for_identical_content(client):
+    from cognigrasp_app import generate_ai_response
+    with patch('cognigrasp_app.generate_ai_response', wraps=generate_ai_response) as analysis:
+        client.post('/process', data={'study_material': 'The Ancient  history of Rome'})
+        client.post('/process', data={'study_material': 'the ancient history\nof rome '})
+        assert analysis.call_count == 1
+
+    first, second = StudyMaterial.query.filter_by(subject='history').order_by(StudyMaterial.id).all()
+    assert first.id != second.id
+    assert first.content_hash == second.content_hash
+    assert first.summary == second.summary
+    assert second.input_text == 'the ancient history\nof rome '
+
+    stats = json.loads(client.get('/api/stats').data)
+    assert stats['result_cache'] == {'hits': 1, 'misses': 1}
+
+
+def test_result_cache_lookup_does_not_write(app):
+    from sqlalchemy import event
+    from database import DatabaseManager, content_hash
+    from models import db
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert DatabaseManager.get_cached_result(content_hash('Nothing stored yet')) is None
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements and all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+    # 计数随下一次保存材料写入
+    DatabaseManager.save_material('Nothing stored yet', 'math', 'Summary', [], [])
+    assert DatabaseManager.get_interaction_stats()['result_cache'] == {'hits': 0, 'misses': 1}
+
+
+def test_content_hasher_matches_content_hash():
+    from database import content_hash
+    from ingest import ContentHasher
+    text = "  The Ancient\thistory of   Rome\n and its KINGS  "
+    for size in (1, 3, 7, len(text)):
+        hasher = ContentHasher()
+        for start in range(0, len(text), size):
+            hasher.update(text[start:start + size])
+        assert hasher.hexdigest() == content_hash(text)
+
+
+def test_api_process_upload_streams_body(client):
+    body = ('filler text ' * 20000 + 'python algorithm').encode('utf-8')
+    response = client.post('/api/process/upload', data=body, content_type='text/plain; charset=utf-8')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['subject'] == 'programming'
+    assert StudyMaterial.query.get(data['material_id']).input_text == body.decode('utf-8')
+
+    for charset in ('bogus', 'hex'):
+        response = client.post('/api/process/upload', data=b'notes', content_type=f'text/plain; charset={charset}')
+        assert response.status_code == 400
+
+
+def test_upload_size_limits_return_413(client, app):
+    from io import BytesIO
+    app.config['MAX_UPLOAD_BYTES'] = 1000
+    try:
+        response = client.post('/api/process/upload', data=b'x' * 1001, content_type='text/plain')
+        assert response.status_code == 413
+
+        response = client.post('/process', data={'study_material': '',
+                                                  'study_file': (BytesIO(b'war ' * 300), 'notes.txt')})
+        assert response.status_code == 413
+        assert b'too large' in response.data
+
+        response = client.post('/process', data={'study_material': 'war ' * 300})
+        assert response.status_code == 413
+    finally:
+        app.config['MAX_UPLOAD_BYTES'] = 16 * 1024 * 1024
+    assert StudyMaterial.query.count() == 1
+
+
+def test_analyze_sections_on_process_pool():
+    from classifier import subject_classifier
+    from sections import analyze_sections, split_sections
+    text = "\n\n".join([
+        "Filler paragraph about nothing in particular. " * 50,
+        "# Chapter 2\nThe ancient empire fought a long war.",
+        "Writing python code for a search algorithm. " * 50,
+    ])
+    assert len(split_sections(text, target_chars=500)) == 3
+
+    overall, sections = analyze_sections(text, target_chars=500, max_workers=2)
+    assert overall == subject_classifier.classify(text) == 'history'
+    assert [section['subject'] for section in sections] == ['general', 'history', 'programming']
+    assert not any(section['timed_out'] for section in sections)
+    assert analyze_sections(text, target_chars=500, max_workers=0) == (overall, sections)
+
+
+def _slow_section_score(text):
+    import time
+    time.sleep(2)
+    return {}
+
+
+def test_analyze_sections_shares_one_deadline(monkeypatch):
+    import time
+    import sections
+    # 分段在子进程中按名字找到这个函数
+    monkeypatch.setattr(sections, 'score_section', _slow_section_score)
+    text = "\n\n".join(["Ancient war notes. " * 50] * 4)
+
+    start = time.perf_counter()
+    overall, analyzed = sections.analyze_sections(text, target_chars=500, timeout=0.5, max_workers=2)
+    # 四段共用 0.5 秒的截止时间，而不是每段各等 0.5 秒
+    assert time.perf_counter() - start < 1.5
+    assert [section['timed_out'] for section in analyzed] == [True] * 4
+    assert overall == 'general'
+    # 超时后丢弃进程池，下一个请求使用新的进程池
+    assert sections._pool is None
+
+
+def test_api_process_sections(client):
+    text = "Quadratic equation practice.\n\nThe ancient war of the kings."
+    response = client.post('/api/process/sections', json={'study_material': text})
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['subject'] == 'math'
+    assert data['sections'][0]['flashcards'] == ["Math flashcard 1", "Math flashcard 2"]
+    assert StudyMaterial.query.get(data['material_id']).subject == 'math'
+
+    assert client.post('/api/process/sections', json=[text]).status_code == 400
+
+
+def test_async_job_lifecycle(client, app):
+    from cognigrasp_app import process_job
+    from worker import run_worker
+
+    assert client.post('/api/jobs', json=['Ancient history notes']).status_code == 400
+    response = client.post('/api/jobs', json={'study_material': 'Ancient history notes'})
+    assert response.status_code == 202
+    job_url = response.headers['Location']
+    assert json.loads(client.get(job_url).data)['status'] == 'queued'
+    assert json.loads(client.get('/api/jobs/stats').data)['queued'] == 1
+
+    assert run_worker(app, process_job, drain=True) == 1
+    job = json.loads(client.get(job_url).data)
+    assert job['status'] == 'done'
+    assert job['attempts'] == 1
+    assert json.loads(client.get(job['material_url']).data)['subject'] == 'history'
+
+
+def test_async_job_retries_then_fails(client, app):
+    from database import DatabaseManager
+    from worker import run_worker
+
+    def broken(job):
+        raise RuntimeError('analysis crashed')
+
+    job_id = DatabaseManager.enqueue_job('Some text', max_attempts=2)
+    assert run_worker(app, broken, retry_backoff=0, drain=True) == 2
+    job = json.loads(client.get(f'/api/jobs/{job_id}').data)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 2
+    assert job['error'] == 'analysis crashed'
+
+
+def test_claim_job_is_exclusive(app):
+    from database import DatabaseManager
+    job_id = DatabaseManager.enqueue_job('Some text')
+    assert DatabaseManager.claim_job('worker-a').id == job_id
+    assert DatabaseManager.claim_job('worker-b') is None
+    # 租期过期后可以被重新领取
+    assert DatabaseManager.claim_job('worker-b', lease_seconds=-1).id == job_id
+
+
+def test_claim_job_gives_up_on_stale_jobs_without_attempts_left(app):
+    from database import DatabaseManager
+    job_id = DatabaseManager.enqueue_job('Some text', max_attempts=2)
+    # 每次领取后 worker 都“死掉”，租期随即过期
+    assert DatabaseManager.claim_job('worker-a', lease_seconds=-1).id == job_id
+    assert DatabaseManager.claim_job('worker-b', lease_seconds=-1).id == job_id
+    assert DatabaseManager.claim_job('worker-c', lease_seconds=-1) is None
+
+    job = DatabaseManager.get_job(job_id)
+    assert job.status == 'failed'
+    assert job.attempts == 2
+    assert job.finished_at is not None
+
+
+def test_claim_job_only_reads_when_nothing_is_claimable(app):
+    from sqlalchemy import event
+    from database import DatabaseManager
+    from models import db
+
+    DatabaseManager.enqueue_job('Some text')
+    assert DatabaseManager.claim_job('worker-a') is not None
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        # 唯一的任务正在运行且租期未过期
+        assert DatabaseManager.claim_job('worker-b') is None
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements and all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+
+def test_job_results_need_the_current_claim(app):
+    from database import DatabaseManager
+    job_id = DatabaseManager.enqueue_job('Some text')
+    slow = DatabaseManager.claim_job('worker-a')
+    assert DatabaseManager.renew_job_lease(slow)
+    # worker-a 的租期过期，任务被 worker-b 重新领取
+    fast = DatabaseManager.claim_job('worker-b', lease_seconds=-1)
+    assert fast.id == job_id
+
+    assert not DatabaseManager.renew_job_lease(slow)
+    assert not DatabaseManager.complete_job(slow, material_id=1)
+    assert not DatabaseManager.fail_job(slow, 'too late')
+    assert DatabaseManager.get_job(job_id).worker_id == 'worker-b'
+
+    assert DatabaseManager.complete_job(fast, material_id=1)
+    job = DatabaseManager.get_job(job_id)
+    assert (job.status, job.attempts, job.error) == ('done', 2, None)
+    assert not DatabaseManager.complete_job(fast, material_id=1)
+
+
+def test_sm2_update():
+    import numpy as np
+    from scheduler import sm2_update
+
+    easiness, interval, repetitions = sm2_update(
+        np.array([2.5, 2.5, 2.5, 2.5]), np.array([0.0, 1.0, 6.0, 6.0]),
+        np.array([0, 1, 2, 2]), np.array([5.0, 4.0, 3.0, 1.0]))
+    assert np.allclose(easiness, [2.6, 2.5, 2.36, 2.5])
+    assert interval.tolist() == [1.0, 6.0, 15.0, 1.0]
+    assert repetitions.tolist() == [1, 2, 3, 0]
+
+
+def test_apply_reviews_in_order_per_card():
+    import numpy as np
+    from scheduler import apply_reviews
+
+    state = {
+        'easiness': np.full(2, 2.5),
+        'interval': np.zeros(2),
+        'repetitions': np.zeros(2, dtype=np.int64),
+        'due_at': np.zeros(2, dtype='datetime64[s]'),
+        'last_reviewed_at': np.zeros(2, dtype='datetime64[s]'),
+    }
+    reviewed_at = np.array(['2026-01-01T00:00', '2026-01-01T01:00', '2026-01-02T00:00', '2026-01-08T00:00'],
+                           dtype='datetime64[s]')
+    apply_reviews(state, np.array([0, 1, 0, 0]), np.array([4.0, 2.0, 4.0, 4.0]), reviewed_at)
+    assert state['repetitions'].tolist() == [3, 0]
+    assert state['interval'].tolist() == [15.0, 1.0]
+    assert state['due_at'][0] == np.datetime64('2026-01-23T00:00', 's')
+    assert state['due_at'][1] == np.datetime64('2026-01-02T01:00', 's')
+
+
+def test_review_interactions_reschedule_cards(client, app):
+    from models import ReviewCard
+    from scheduler import reschedule_reviews
+
+    material_id = json.loads(client.post('/api/process/batch', json={'study_materials': ['Quadratic equation']}).data)['results'][0]['material_id']
+    assert client.post('/api/interaction', json={
+        'material_id': material_id, 'interaction_type': 'review', 'card_index': 0, 'quality': 9
+    }).status_code == 400
+    for quality in (5, 4):
+        assert client.post('/api/interaction', json={
+            'material_id': material_id, 'interaction_type': 'review', 'card_index': 0, 'quality': quality
+        }).status_code == 200
+
+    with app.app_context():
+        assert reschedule_reviews() == 2
+        card = ReviewCard.query.get((material_id, 0))
+        assert (card.repetitions, card.interval_days) == (2, 6.0)
+        # 已处理的复习不会被重复应用
+        assert reschedule_reviews() == 0
+
+
+def test_reschedule_reviews_applies_late_commits(app):
+    from models import db, ReviewCard, UserInteraction
+    from scheduler import reschedule_reviews
+
+    def review(interaction_id, quality):
+        return UserInteraction(id=interaction_id, material_id=1, interaction_type='review',
+                               interaction_data=json.dumps({'card_index': 0, 'quality': quality}))
+
+    db.session.add_all([review(10, 5), review(12, 5)])
+    db.session.commit()
+    assert reschedule_reviews() == 2
+
+    # PostgreSQL 中并发事务可能在 id 更大的复习之后才提交 id 更小的复习
+    db.session.add(review(11, 5))
+    db.session.commit()
+    assert reschedule_reviews() == 1
+    assert db.session.get(ReviewCard, (1, 0)).repetitions == 3
+    assert reschedule_reviews() == 0
+
+    plans = _query_plans(reschedule_reviews)
+    assert any('ix_user_interactions_type_scheduled_at' in plan for plan in plans), plans
+
+
+def test_api_reviews_due_pages_by_due_time(client):
+    from models import db
+    material = StudyMaterial(
+        input_text="Scheduled notes", subject="math", summary="Summary", flashcards=[],
+        review_dates=["2024-01-01 06:00", "2024-01-02 00:00", "not a date", "2024-02-01 00:00"])
+    db.session.add(material)
+    db.session.commit()
+
+    seen = []
+    url = '/api/reviews/due?before=2024-01-15T00:00&limit=1'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend((review['material_id'], review['position'], review['due_at'])
+                    for review in json.loads(response.data))
+        url = response.headers['Link'].split(';')[0].strip('<>') if 'Link' in response.headers else None
+    # 测试夹具中的资料（2023 年）排在前面
+    assert seen[-2:] == [(material.id, 0, '2024-01-01T06:00:00'), (material.id, 1, '2024-01-02T00:00:00')]
+    assert [due_at for _, _, due_at in seen] == sorted(due_at for _, _, due_at in seen)
+
+    assert client.get('/api/reviews/due?before=yesterday').status_code == 400
+    assert client.get('/api/reviews/due?cursor=bogus').status_code == 400
+
+
+def test_backfill_review_dates(app):
+    from models import db
+    from database import DatabaseManager
+    from models import ReviewDate
+
+    db.session.execute(db.delete(ReviewDate))
+    db.session.commit()
+    expected = sum(len(material.review_dates) for material in StudyMaterial.query)
+    assert DatabaseManager.backfill_review_dates(batch_size=1) == expected
+    assert ReviewDate.query.count() == expected
+    assert DatabaseManager.backfill_review_dates() == 0
+
+
+def test_due_reviews_query_uses_index(app):
+    from datetime import datetime
+    from database import DatabaseManager
+    from models import ReviewDate
+    cursor = DatabaseManager.encode_review_cursor(ReviewDate.query.first())
+    plans = _query_plans(lambda: DatabaseManager.get_due_reviews(datetime.utcnow(), 10, cursor))
+    assert 'USING COVERING INDEX ix_review_dates_due_at' in plans[0], plans[0]
+    assert 'INDEX ix_review_cards_due_at' in plans[1], plans[1]
+    assert all('TEMP B-TREE' not in plan for plan in plans), plans
+
+
+def test_api_reviews_due_follows_graded_reviews(client):
+    from datetime import datetime, timedelta
+    from scheduler import reschedule_reviews
+
+    response = client.post('/api/process/batch', json={'study_materials': ['Derivative practice notes']})
+    material_id = json.loads(response.data)['results'][0]['material_id']
+
+    def due(days):
+        before = (datetime.utcnow() + timedelta(days=days)).isoformat()
+        reviews = json.loads(client.get(f'/api/reviews/due?before={before}&limit=1000').data)
+        return [review for review in reviews if review['material_id'] == material_id]
+
+    # 还没有复习记录时使用固定的复习计划（6 小时、1 天后……）
+    assert [(review['source'], review['position']) for review in due(2)] == [('schedule', 0), ('schedule', 1)]
+
+    for quality in (5, 5):
+        client.post('/api/interaction', json={'material_id': material_id, 'interaction_type': 'review',
+                                              'card_index': 0, 'quality': quality})
+    assert reschedule_reviews() == 2
+    # 连续两次答对后 SM-2 间隔为 6 天，原计划中的复习不再出现
+    assert due(2) == []
+    (review,) = due(7)
+    assert (review['source'], review['position']) == ('card', 0)
+    due_at = datetime.fromisoformat(review['due_at'])
+    assert timedelta(days=5.9) < due_at - datetime.utcnow() < timedelta(days=6.1)
+    # 带时区的 before 换算成 UTC：6 天 4 小时后 +08:00 即 UTC 5 天 20 小时后
+    before = (datetime.utcnow() + timedelta(days=6, hours=4)).strftime('%Y-%m-%dT%H:%M:%S') + '+08:00'
+    reviews = json.loads(client.get('/api/reviews/due', query_string={'before': before, 'limit': 1000}).data)
+    assert material_id not in {review['material_id'] for review in reviews}
+
+
+def test_materials_stored_as_template_references(client):
+    response = client.post('/api/process/batch', json={'study_materials': ['Quadratic equation practice']})
+    result = json.loads(response.data)['results'][0]
+    material = StudyMaterial.query.get(result['material_id'])
+    assert material.summary is None and material.flashcards is None
+    assert material.config_version.version == 1
+
+    expected = {key: result[key] for key in ('summary', 'flashcards')}
+    listed = [m for m in json.loads(client.get('/api/materials').data) if m['id'] == material.id][0]
+    single = json.loads(client.get(f'/api/materials/{material.id}').data)
+    assert {key: listed[key] for key in expected} == {key: single[key] for key in expected} == expected
+
+    # 配置版本不可变：修改配置后旧资料仍按原版本渲染
+    client.put('/api/subject-configs/math', json={'summary_template': 'Changed', 'flashcards': ['New card']})
+    assert {key: json.loads(client.get(f'/api/materials/{material.id}').data)[key] for key in expected} == expected
+    assert b'Changed' not in client.get(f'/material/{material.id}').data
+
+
+def test_compact_materials(app):
+    from models import db
+    from database import DatabaseManager
+    copied = StudyMaterial(
+        input_text="Old material", subject="math", summary="Math summary template\n\nMath variation 2",
+        flashcards=["Math flashcard 1", "Math flashcard 2"], review_dates=[])
+    edited = StudyMaterial(
+        input_text="Edited material", subject="math", summary="Hand-written summary",
+        flashcards=["Math flashcard 1", "Math flashcard 2"], review_dates=[])
+    db.session.add_all([copied, edited])
+    db.session.commit()
+    before = [copied.to_dict(), edited.to_dict()]
+
+    assert DatabaseManager.compact_materials() == 1
+    db.session.expire_all()
+    assert (copied.summary, copied.variation_index) == (None, 1)
+    assert edited.config_version_id is None
+    assert [copied.to_dict(), edited.to_dict()] == before
+    assert DatabaseManager.compact_materials() == 0
+
+
+def test_sqlite_pragmas_let_reads_proceed_during_writes(tmp_path):
+    import threading
+    import time
+    from sqlalchemy import create_engine
+    from config import Config
+    from database import apply_sqlite_pragmas
+
+    engine = create_engine(f'sqlite:///{tmp_path / "concurrency.db"}')
+    apply_sqlite_pragmas(engine, Config.SQLITE_PRAGMAS)
+    setup = engine.raw_connection()
+    assert setup.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    setup.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)')
+    setup.execute("INSERT INTO notes (body) VALUES ('committed')")
+    setup.commit()
+    setup.close()
+
+    writer = engine.raw_connection()
+    writer.isolation_level = None
+    writer.execute('BEGIN EXCLUSIVE')
+    writer.execute("INSERT INTO notes (body) VALUES ('pending')")
+
+    # 写事务未提交时，读取立即返回已提交的数据，而不是报 "database is locked"
+    reader = engine.raw_connection()
+    start = time.monotonic()
+    assert reader.execute('SELECT count(*) FROM notes').fetchone()[0] == 1
+    assert time.monotonic() - start < 1
+    reader.close()
+
+    # 第二个写入者按 busy_timeout 等待锁释放
+    def second_write():
+        other = engine.raw_connection()
+        other.execute("INSERT INTO notes (body) VALUES ('second')")
+        other.commit()
+        other.close()
+
+    thread = threading.Thread(target=second_write)
+    thread.start()
+    time.sleep(0.2)
+    writer.execute('COMMIT')
+    thread.join(timeout=5)
+    writer.close()
+
+    check = engine.raw_connection()
+    assert check.execute('SELECT count(*) FROM notes').fetchone()[0] == 3
+    check.close()
+    engine.dispose()
+
+
+def test_create_app_does_no_database_io(tmp_path):
+    from cognigrasp_app import create_app
+    from config import Config
+    from database import DatabaseManager
+    from models import db, SubjectConfig
+
+    class FileConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "factory.db"}'
+
+    flask_app = create_app(FileConfig)
+    assert not (tmp_path / 'factory.db').exists()
+
+    result = flask_app.test_cli_runner().invoke(args=['init-db', '--no-sample-data'])
+    assert result.exit_code == 0, result.output
+    with flask_app.app_context():
+        assert SubjectConfig.query.count() == 5
+        assert StudyMaterial.query.count() == 0
+        # 重复执行是安全的
+        DatabaseManager.init_db(sample_data=False)
+        assert SubjectConfig.query.count() == 5
+        db.engine.dispose()
+
+
+def test_engine_options_follow_the_configured_uri(app, tmp_path):
+    from cognigrasp_app import create_app
+    from config import Config
+
+    # 内存数据库使用 StaticPool，不能带连接池大小参数
+    assert 'pool_size' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+
+    class FileConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "pooled.db"}'
+
+    assert 'pool_size' in create_app(FileConfig).config['SQLALCHEMY_ENGINE_OPTIONS']
+
+    class ExplicitConfig(FileConfig):
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 2}
+
+    assert create_app(ExplicitConfig).config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_size': 2}
+
+
+def test_api_process_returns_json(client):
+    with patch('cognigrasp_app.render_template') as render:
+        response = client.post('/api/process', json={'study_material': 'Solve the quadratic equation'})
+    render.assert_not_called()
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    data = json.loads(response.data)
+    assert data['subject'] == 'math'
+    assert data['flashcards'] == ["Math flashcard 1", "Math flashcard 2"]
+    assert len(data['review_dates']) == 4
+    assert json.loads(client.get(f"/api/materials/{data['material_id']}").data)['summary'] == data['summary']
+
+    assert client.post('/api/process', json={'study_material': '  '}).status_code == 400
+    assert client.post('/api/process', data='not json', content_type='application/json').status_code == 400
+
+
+def test_benchmark_data_generator(client):
+    from benchmarks.generate_data import generate
+    from models import db, SubjectConfig
+    from database import DatabaseManager
+
+    for subject in ('history', 'science', 'programming', 'general'):
+        db.session.add(SubjectConfig(subject_name=subject, summary_template=f"{subject} template",
+                                     flashcards=[f"{subject} card"], variations=[f"{subject} variation"]))
+    db.session.commit()
+    DatabaseManager.invalidate_subject_config_cache()
+
+    generate(db, 10, 30, batch_size=4)
+    stats = json.loads(client.get('/api/stats').data)
+    assert stats['total_materials'] == 11
+    assert stats['total_interactions'] == 30
+    assert stats['materials_by_subject'] == {'math': 3, 'history': 2, 'science': 2, 'programming': 2, 'general': 2}
+    generated = StudyMaterial.query.filter_by(subject='history').first()
+    assert generated.to_dict()['summary'] == "history template\n\nhistory variation"
+
+
+def test_metrics_endpoint(client):
+    client.post('/process', data={'study_material': 'Ancient history of the war'})
+    client.get('/api/materials/1')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'cognigrasp_http_request_duration_seconds_count{method="POST",route="/process"} 1' in text
+    assert 'cognigrasp_http_requests_total{method="GET",route="/api/materials/<int:material_id>",status="200"} 1' in text
+    for phase in ('classify', 'persist', 'render'):
+        assert f'cognigrasp_phase_duration_seconds_count{{phase="{phase}"}} 1' in text
+    query_count = [line for line in text.splitlines()
+                   if line.startswith('cognigrasp_http_request_sql_queries_sum{route="/process"}')]
+    assert float(query_count[0].split()[-1]) > 0
+
+
+def test_slow_requests_are_logged(app, client, caplog):
+    app.extensions['metrics'].slow_request_seconds = 1e-9
+    with caplog.at_level('WARNING'):
+        client.post('/process', data={'study_material': 'Quadratic equation'})
+    assert any(record.getMessage().startswith('Slow request: POST /process -> 200')
+               and 'persist=' in record.getMessage() for record in caplog.records)
+
+
+def test_loadtest_mix_from_interactions(client):
+    from benchmarks.loadtest import mix_from_interactions, parse_mix, percentile
+    from database import DatabaseManager
+    from models import db
+
+    for interaction_type, count in (('process', 1), ('view', 4), ('api_view', 2), ('review', 2), ('click', 1)):
+        for _ in range(count):
+            DatabaseManager.log_interaction(1, interaction_type)
+    with db.engine.connect() as connection:
+        mix = mix_from_interactions(connection)
+    assert mix == {'process': 0.1, 'material': 0.4, 'api_material': 0.2, 'interaction': 0.3}
+
+    assert parse_mix('process=1, stats=0.5') == {'process': 1.0, 'stats': 0.5}
+    with pytest.raises(ValueError):
+        parse_mix('upload=1')
+    assert percentile([0.1, 0.2, 0.3, 0.4], 0.5) == 0.2
+    assert percentile([0.1, 0.2, 0.3, 0.4], 0.99) == 0.4
+
+
+def test_search_materials(client):
+    for text in ('Quadratic equations and the quadratic formula', 'Derivatives of polynomial equations',
+                 'The French revolution'):
+        client.post('/api/process', json={'study_material': text})
+
+    response = client.get('/api/materials/search?q=quadratic&limit=1')
+    assert response.status_code == 200
+    results = json.loads(response.data)
+    assert [result['id'] for result in results] == [2]
+    assert '**Quadratic**' in results[0]['snippet']
+    assert results[0]['material_url'] == '/api/materials/2'
+    assert 'X-Next-Cursor' not in response.headers
+
+    # 词干匹配、前缀匹配，摘要按模板存储时也能搜到
+    response = client.get('/api/materials/search?q=equation&limit=1&order=newest')
+    assert [result['id'] for result in json.loads(response.data)] == [3]
+    response = client.get(f"/api/materials/search?q=equation&limit=1&order=newest"
+                          f"&cursor={response.headers['X-Next-Cursor']}")
+    assert [result['id'] for result in json.loads(response.data)] == [2]
+    assert [r['id'] for r in json.loads(client.get('/api/materials/search?q=revol*').data)] == [4]
+    assert StudyMaterial.query.get(2).summary is None
+    results = json.loads(client.get('/api/materials/search?q=math+variation&order=newest').data)
+    assert [result['id'] for result in results] == [3, 2]
+
+    assert client.get('/api/materials/search?q=%22+*').status_code == 400
+    assert client.get('/api/materials/search?q=war&cursor=bad').status_code == 400
+    assert client.get('/api/materials/search?q=war&order=oldest').status_code == 400
+
+
+def test_backfill_search_index(client):
+    from database import DatabaseManager
+    from models import db
+
+    # 核心层批量插入绕过 ORM 事件，需要回填索引
+    db.session.execute(StudyMaterial.__table__.insert(), [
+        {'input_text': f'Photosynthesis notes {i}', 'subject': 'science', 'summary': 'Science summary',
+         'flashcards': [], 'review_dates': []} for i in range(3)])
+    db.session.commit()
+    assert json.loads(client.get('/api/materials/search?q=photosynthesis').data) == []
+
+    assert DatabaseManager.backfill_search_index(batch_size=2) == 3
+    assert DatabaseManager.backfill_search_index() == 0
+    results = json.loads(client.get('/api/materials/search?q=photosynthesis').data)
+    assert sorted(result['id'] for result in results) == [2, 3, 4]
+
+
+def test_search_unavailable_without_fts5(client, monkeypatch):
+    import database
+    from database import DatabaseManager
+    from models import db
+
+    assert DatabaseManager.search_available()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP TABLE material_search')
+    # 结果按引擎缓存，删表后仍是旧值；清掉缓存后才会重新检查
+    assert DatabaseManager.search_available()
+    DatabaseManager._search_available.clear()
+    assert not DatabaseManager.search_available()
+    # 没有索引表时保存资料不写索引，搜索接口返回 501
+    assert client.post('/api/process', json={'study_material': 'Quadratic notes'}).status_code == 200
+    assert client.get('/api/materials/search?q=quadratic').status_code == 501
+
+    # SQLite 没有编译 FTS5 时不建索引表
+    monkeypatch.setattr(database, 'sqlite_has_fts5', lambda connection: False)
+    monkeypatch.setattr('models.sqlite_has_fts5', lambda connection: False)
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    assert not DatabaseManager.search_available()
+    assert client.post('/api/process', json={'study_material': 'Derivative notes'}).status_code == 200
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'material_search'").first() is None
+
+
+def test_related_materials(app, client, tmp_path):
+    app.config.update(RELATED_INDEX_PATH=str(tmp_path), RELATED_INDEX_REFRESH_INTERVAL=0)
+    for text in ('Quadratic equations and the quadratic formula for finding roots',
+                 'Photosynthesis converts light energy in plant cells',
+                 'Practice problems on the quadratic formula'):
+        client.post('/api/process', json={'study_material': text})
+
+    related = json.loads(client.get('/api/materials/2/related').data)
+    assert [material['id'] for material in related] == [4]
+    assert related[0]['preview'] == 'Practice problems on the quadratic formula'
+    assert related[0]['material_url'] == '/material/4'
+    assert 0 < related[0]['score'] < 1
+
+    # 快照之后保存的资料从数据库追加进索引
+    result = app.test_cli_runner().invoke(args=['build-related-index'])
+    assert 'Indexed 4 material(s).' in result.output
+    app.extensions.pop('related_index')
+    client.post('/api/process', json={'study_material': 'Roots of a quadratic'})
+    assert [material['id'] for material in json.loads(client.get('/api/materials/2/related?k=1').data)] == [5]
+    assert client.get('/api/materials/99/related').status_code == 404
+
+
+def test_related_index_snapshot_matches_exact_cosine(tmp_path):
+    import numpy as np
+    from related import RelatedIndex, term_vector
+
+    texts = ['alpha beta gamma', 'alpha beta delta', 'gamma delta epsilon', 'alpha alpha zeta', 'beta epsilon']
+    index = RelatedIndex()
+    index.add([(1, texts[0]), (2, texts[1])])
+    index.add([(3, texts[2]), (4, texts[3]), (5, texts[4])])
+    # 保存时所有段按当前 idf 合并并重新归一化
+    index.save(str(tmp_path))
+    snapshot = RelatedIndex.load(str(tmp_path), RelatedIndex.current_version(str(tmp_path)))
+    assert (snapshot.doc_count, snapshot.last_id) == (5, 5)
+
+    vectors = []
+    for text in texts:
+        terms, tf = term_vector(text)
+        vector = np.zeros(len(snapshot.df))
+        vector[terms] = tf * snapshot._idf[terms]
+        vectors.append(vector / np.linalg.norm(vector))
+    results = snapshot.top_k(list(enumerate(texts, 1)), k=4)
+    for query_id, related in enumerate(results, 1):
+        expected = {other: vectors[query_id - 1] @ vectors[other - 1] for other in range(1, 6)
+                    if other != query_id and vectors[query_id - 1] @ vectors[other - 1] > 0}
+        assert {material_id for material_id, _ in related} == set(expected)
+        for material_id, score in related:
+            assert score == pytest.approx(expected[material_id], rel=1e-5)
+        assert [score for _, score in related] == sorted((score for _, score in related), reverse=True)
@@ -1,16 +1,14 @@
 import unittest
 from flask_testing import TestCase
-from cognigrasp_demo import app, db
-from models import StudyMaterial
+import cognigrasp_app
+from conftest import TestingConfig
+from models import db, StudyMaterial
 import json
 
 
 class CogniGraspIntegrationTestCase(TestCase):
     def create_app(self):
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        return app
+        return cognigrasp_app.create_app(TestingConfig)
 
     def setUp(self):
         db.create_all()
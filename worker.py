@@ -0,0 +1,78 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from database import DatabaseManager
+from models import db
+
+
+def _renew_lease(app, job, interval, done):
+    """Runs in a thread while a job is handled: renew its lease every `interval` seconds"""
+    with app.app_context():
+        try:
+            while not done.wait(interval):
+                if not DatabaseManager.renew_job_lease(job):
+                    app.logger.warning('Lost the claim on job %s', job.id)
+                    return
+        finally:
+            db.session.remove()
+
+
+def run_worker(app, handle_job, poll_interval=1.0, lease_seconds=300, retry_backoff=5, drain=False):
+    """Claim and run queued jobs until stopped; returns the number of jobs handled.
+
+    `handle_job(job)` does the work and returns the new material id. Any number
+    of workers can run against the same database. While a job runs its lease is
+    renewed every third of `lease_seconds`, so only jobs of a worker that died
+    are claimed again. SIGTERM/SIGINT stop the loop after the current job. With
+    `drain` the worker exits once the queue is empty.
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    if not drain:
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+    handled = 0
+    with app.app_context():
+        while not stopping:
+            job = DatabaseManager.claim_job(worker_id, lease_seconds)
+            if job is None:
+                if drain:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            done = threading.Event()
+            heartbeat = threading.Thread(target=_renew_lease, args=(app, job, lease_seconds / 3, done), daemon=True)
+            if lease_seconds > 0:
+                heartbeat.start()
+            error = None
+            try:
+                material_id = handle_job(job)
+            except Exception as e:
+                app.logger.exception('Job %s failed on attempt %s', job.id, job.attempts)
+                error = e
+            finally:
+                done.set()
+                if heartbeat.is_alive():
+                    heartbeat.join()
+
+            if error is not None:
+                recorded = DatabaseManager.fail_job(job, str(error), retry_backoff)
+            else:
+                recorded = DatabaseManager.complete_job(job, material_id)
+            if not recorded:
+                # 租期过期后任务已被其他 worker 重新领取，这次的结果不记录
+                app.logger.warning('Job %s was claimed again by another worker; attempt %s not recorded',
+                                   job.id, job.attempts)
+            handled += 1
+            # 每个任务结束后释放 session，避免长期运行时对象堆积
+            db.session.remove()
+    return handled